@@ -1,3 +1,3 @@
 #!/bin/bash
 
-python -m experiment.k8 --n-workers 10 --micro-step 1 --macro-step 1 --print-secs 5 --run local-david-20 --master-works
+python -m experiment.k8 --n-workers 10 --micro-step 1 --macro-step 1 --print-secs 5 --run local-david-20 --master-works --queue-type memory
@@ -189,6 +189,7 @@ class RepeatCopy(snt.AbstractModule):
       norm_max=10,
       log_prob_in_bits=False,
       time_average_cost=False,
+      vectorise=False,
       name='repeat_copy',):
     """Creates an instance of RepeatCopy task.
 
@@ -213,6 +214,10 @@ class RepeatCopy(snt.AbstractModule):
           divided by the `true`, sequence length, the number of non-masked time
           steps, in each sequence before any subsequent reduction over the time
           and batch dimensions.
+      vectorise: If true, build the batch with masked, batched ops whose count
+          does not depend on `batch_size`, rather than a per-element loop.
+          Both modes sample from the same distribution but draw different
+          random patterns.
     """
     super(RepeatCopy, self).__init__(name=name)
 
@@ -225,6 +230,7 @@ class RepeatCopy(snt.AbstractModule):
     self._norm_max = norm_max
     self._log_prob_in_bits = log_prob_in_bits
     self._time_average_cost = time_average_cost
+    self._vectorise = vectorise
 
   def _normalise(self, val):
     return val / self._norm_max
@@ -290,6 +296,14 @@ class RepeatCopy(snt.AbstractModule):
     targ_batch_shape = [max_length_batch, batch_size, full_targ_size]
     mask_batch_trans_shape = [batch_size, max_length_batch]
 
+    if self._vectorise:
+      obs, targ, mask = self._build_vectorised(
+          sub_seq_length_batch, num_repeats_batch, max_length_batch)
+      obs = tf.reshape(obs, obs_batch_shape)
+      targ = tf.reshape(targ, targ_batch_shape)
+      return DatasetTensors(obs, targ, mask, total_length_batch,
+                            total_targ_batch)
+
     obs_tensors = []
     targ_tensors = []
     mask_tensors = []
@@ -386,6 +400,79 @@ class RepeatCopy(snt.AbstractModule):
         tf.reshape(tf.concat(mask_tensors, 0), mask_batch_trans_shape))
     return DatasetTensors(obs, targ, mask, total_length_batch, total_targ_batch)
 
+  def _build_vectorised(self, sub_seq_length_batch, num_repeats_batch,
+                        max_length_batch):
+    """Builds (obs, targ, mask) for the whole batch at once.
+
+    Every time step of every batch element is computed from a time index and
+    the per-element pattern length and repeat count, so the number of ops
+    added to the graph is independent of batch size. Layout matches the
+    unrolled version: obs holds the start flag at t=0, the pattern for
+    1 <= t <= L and the num-repeats flag at t=L+1; targ holds the pattern
+    repeated R times from t=L+2 followed by the end flag; mask is one over
+    the target span.
+
+    Args:
+      sub_seq_length_batch: `[batch_size]` int32 tensor of pattern lengths L.
+      num_repeats_batch: `[batch_size]` int32 tensor of repeat counts R.
+      max_length_batch: scalar int32 tensor, the padded sequence length T.
+
+    Returns:
+      Time-major tensors obs `[T, B, num_bits + 2]`, targ `[T, B, num_bits + 1]`
+      and mask `[T, B]`.
+    """
+    num_bits = self.num_bits
+    batch_size = self.batch_size
+    max_length = max(self._max_length, 1)
+
+    # Every batch element draws a full-length pattern and uses its first L rows.
+    obs_pattern = tf.cast(
+        tf.random_uniform(
+            [batch_size, max_length, num_bits], minval=0, maxval=2,
+            dtype=tf.int32),
+        tf.float32)
+
+    # [T, B] grids of the time index, pattern length and repeat count.
+    time = tf.expand_dims(tf.range(max_length_batch), 1)
+    zeros = tf.zeros([max_length_batch, batch_size], dtype=tf.int32)
+    time = time + zeros
+    sub_seq_len = tf.expand_dims(sub_seq_length_batch, 0) + zeros
+    num_reps = tf.expand_dims(num_repeats_batch, 0) + zeros
+    batch_index = tf.expand_dims(tf.range(batch_size), 0) + zeros
+
+    targ_start = sub_seq_len + 2
+    targ_end = targ_start + sub_seq_len * num_reps
+
+    def gather_pattern(pattern_index, on):
+      pattern_index = tf.clip_by_value(pattern_index, 0, max_length - 1)
+      indices = tf.stack([batch_index, pattern_index], axis=2)
+      rows = tf.gather_nd(obs_pattern, indices)
+      return rows * tf.expand_dims(tf.cast(on, tf.float32), 2)
+
+    def as_channel(value):
+      return tf.expand_dims(tf.cast(value, tf.float32), 2)
+
+    # Observation: start flag, the pattern, then the normalised repeat count.
+    obs_on = tf.logical_and(time >= 1, time <= sub_seq_len)
+    obs_bits = gather_pattern(time - 1, obs_on)
+    obs_start_flag = as_channel(tf.equal(time, 0))
+    num_reps_flag = as_channel(tf.equal(time, sub_seq_len + 1)) * as_channel(
+        self._normalise(tf.cast(num_reps, tf.float32)))
+    obs = tf.concat([obs_bits, obs_start_flag, num_reps_flag], 2)
+
+    # Target: the pattern repeated, followed by the end flag.
+    targ_on = tf.logical_and(time >= targ_start, time < targ_end)
+    targ_index = tf.floormod(time - targ_start, tf.maximum(sub_seq_len, 1))
+    targ_bits = gather_pattern(targ_index, targ_on)
+    targ_end_flag = as_channel(tf.equal(time, targ_end))
+    targ = tf.concat([targ_bits, targ_end_flag], 2)
+
+    # The mask is one over the target pattern and its end flag.
+    mask = tf.cast(
+        tf.logical_and(time >= targ_start, time <= targ_end), tf.float32)
+
+    return obs, targ, mask
+
   def cost(self, logits, targ, mask):
     return masked_sigmoid_cross_entropy(
         logits,
@@ -0,0 +1,78 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the repeat copy task."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+import repeat_copy
+
+NUM_BITS = 4
+BATCH_SIZE = 8
+
+
+class VectorisedRepeatCopyTest(tf.test.TestCase):
+
+  def testLayout(self):
+    dataset = repeat_copy.RepeatCopy(
+        num_bits=NUM_BITS,
+        batch_size=BATCH_SIZE,
+        min_length=1,
+        max_length=3,
+        min_repeats=1,
+        max_repeats=4,
+        vectorise=True)
+    tensors = dataset()
+
+    with self.test_session() as sess:
+      data = sess.run(tensors)
+
+    obs, targ, mask = data.observations, data.target, data.mask
+    self.assertEqual(obs.shape[1:], (BATCH_SIZE, NUM_BITS + 2))
+    self.assertEqual(targ.shape[1:], (BATCH_SIZE, NUM_BITS + 1))
+    self.assertEqual(obs.shape[0], np.max(data.length))
+
+    for b in range(BATCH_SIZE):
+      num_reps = int(round(obs[:, b, -1].sum() * 10))
+      pattern_length = (data.length[b] - 3) // (num_reps + 1)
+      targ_start = pattern_length + 2
+      targ_end = targ_start + pattern_length * num_reps
+
+      # Observation flags.
+      self.assertEqual(obs[0, b, NUM_BITS], 1)
+      self.assertEqual(obs[:, b, NUM_BITS].sum(), 1)
+      self.assertGreater(obs[pattern_length + 1, b, NUM_BITS + 1], 0)
+
+      # Target is the observed pattern repeated, then the end marker.
+      pattern = obs[1:pattern_length + 1, b, :NUM_BITS]
+      self.assertAllEqual(targ[targ_start:targ_end, b, :NUM_BITS],
+                          np.tile(pattern, (num_reps, 1)))
+      self.assertEqual(targ[targ_end, b, NUM_BITS], 1)
+      self.assertEqual(targ[:, b].sum(), pattern.sum() * num_reps + 1)
+
+      # Mask covers exactly the target span.
+      self.assertEqual(mask[:, b].sum(), pattern_length * num_reps + 1)
+      self.assertAllEqual(mask[targ_start:targ_end + 1, b],
+                          np.ones(pattern_length * num_reps + 1))
+      self.assertEqual(data.total_targ_batch[b],
+                       (pattern_length * num_reps + 1) * (NUM_BITS + 1))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -22,20 +22,35 @@ import numpy as np
 import tensorflow as tf
 
 
+def _batch_indices(indices):
+  """Returns `[..., 2]` (batch, index) pairs for gather_nd/scatter_nd."""
+  batch_range = tf.range(tf.shape(indices)[0], dtype=indices.dtype)
+  batch_index = tf.zeros_like(indices) + tf.expand_dims(batch_range, 1)
+  return tf.stack([batch_index, indices], axis=2)
+
+
 def batch_invert_permutation(permutations):
-  """Returns batched `tf.invert_permutation` for every row in `permutations`."""
+  """Returns batched `tf.invert_permutation` for every row in `permutations`.
+
+  Implemented as a single scatter so the op count is independent of batch size.
+  """
   with tf.name_scope('batch_invert_permutation', values=[permutations]):
-    unpacked = tf.unstack(permutations)
-    inverses = [tf.invert_permutation(permutation) for permutation in unpacked]
-    return tf.stack(inverses)
+    positions = tf.zeros_like(permutations) + tf.expand_dims(
+        tf.range(tf.shape(permutations)[1], dtype=permutations.dtype), 0)
+    inverses = tf.scatter_nd(
+        _batch_indices(permutations), positions, tf.shape(permutations))
+    inverses.set_shape(permutations.get_shape())
+    return inverses
 
 
 def batch_gather(values, indices):
-  """Returns batched `tf.gather` for every row in the input."""
+  """Returns batched `tf.gather` for every row in the input.
+
+  Implemented as a single `tf.gather_nd` so the op count is independent of
+  batch size. Gradients flow to `values` as with `tf.gather`.
+  """
   with tf.name_scope('batch_gather', values=[values, indices]):
-    unpacked = zip(tf.unstack(values), tf.unstack(indices))
-    result = [tf.gather(value, index) for value, index in unpacked]
-    return tf.stack(result)
+    return tf.gather_nd(values, _batch_indices(indices))
 
 
 def one_hot(length, index):
@@ -56,6 +56,14 @@ class BatchGather(tf.test.TestCase):
       result = result.eval()
     self.assertAllEqual(target, result)
 
+  def testGradient(self):
+    values = tf.constant(np.random.randn(3, 4))
+    indexs = tf.constant(np.array([[1, 2, 0, 3], [3, 0, 1, 2], [0, 2, 1, 3]]))
+    result = util.batch_gather(values, indexs)
+    with self.test_session():
+      err = tf.test.compute_gradient_error(values, [3, 4], result, [3, 4])
+    self.assertLess(err, 1e-4)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -23,9 +23,10 @@ MAX_REPEATS = int(os.getenv("MAX_REPEATS", 5))
 
 class DatasetParam(GeneticParam):
 
-	def __init__(self, batch_size, v=None):
+	def __init__(self, batch_size, v=None, vectorise=False):
 
 		self.batch_size = batch_size
+		self.vectorise = vectorise
 		self.v = v
 
 		if self.v is None:
@@ -42,7 +43,7 @@ class DatasetParam(GeneticParam):
 		}
 
 	def mutate(self, heat):
-		return type(self)(self.batch_size, self._mutate_dict(heat))
+		return type(self)(self.batch_size, self._mutate_dict(heat), self.vectorise)
 
 	@property
 	def name_str(self):
@@ -54,6 +55,8 @@ class DatasetParam(GeneticParam):
 		return repeat_copy.RepeatCopy(
 			num_bits=4, 
 			batch_size=self.batch_size, 
+			# Draws different data to the unrolled build, so scores aren't comparable across the two
+			vectorise=getattr(self, "vectorise", False),
 			**self.metric
 		)
 
@@ -70,22 +73,22 @@ class DatasetParam(GeneticParam):
 		}
 
 
-def DatasetParamOf(batch_size):
+def DatasetParamOf(batch_size, vectorise=False):
 	def m(v=None):
-		return DatasetParam(batch_size, v)
+		return DatasetParam(batch_size, v, vectorise)
 	return m
 
 def gen_dataset_eval(args):
 	return lambda: DatasetParam(args.batch_size, {
 		"length":  RangeParam([FixedParam(MAX_LENGTH), FixedParam(MAX_LENGTH)]),
 		"repeats": RangeParam([FixedParam(MAX_REPEATS), FixedParam(MAX_REPEATS)])
-	})
+	}, args.vectorise_dataset)
 
 def gen_param_spec(args):
 	return ParamSpec({
 		"heritage": Heritage,
 		"model_id": ModelId,
-		"dataset_train": DatasetParamOf(args.batch_size),
+		"dataset_train": DatasetParamOf(args.batch_size, args.vectorise_dataset),
 		"dataset_eval": gen_dataset_eval(args)
 	})
 
@@ -157,7 +160,7 @@ def gen_baseline_params(args):
 				datasets.append(DatasetParam(args.batch_size, {
 					"length":  RangeParam([FixedParam(i), FixedParam(MAX_LENGTH)]),
 					"repeats": RangeParam([FixedParam(j), FixedParam(MAX_REPEATS)]),
-				}))
+				}, args.vectorise_dataset))
 
 		param_sets = []
 		for i in datasets:
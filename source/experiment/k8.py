@@ -12,6 +12,8 @@ import platform
 import time
 import pika
 import threading
+import multiprocessing
+import os
 import traceback
 
 from .helpers import *
@@ -104,29 +106,78 @@ def do_supervisor(args):
 		raise e
 
 
+def partition_cores(n):
+	"""Split the cores we may run on into n disjoint sets (shared if too few)"""
+	try:
+		cores = sorted(os.sched_getaffinity(0))
+	except AttributeError:
+		cores = list(range(multiprocessing.cpu_count()))
+
+	chunk = len(cores) // n
+
+	if chunk == 0:
+		return [[cores[k % len(cores)]] for k in range(n)]
+
+	return [cores[k*chunk : (k+1)*chunk] for k in range(n)]
+
+def do_drone_process(args, cores):
+	"""Entry point of a drone child process, pinned to cores"""
+	try:
+		os.sched_setaffinity(0, cores)
+	except AttributeError:
+		logger.warning("Cannot set CPU affinity on this platform")
+
+	# Size TF's pools to our cores rather than the whole machine
+	if args.intra_op_threads == 0:
+		args.intra_op_threads = len(cores)
+	if args.inter_op_threads == 0:
+		args.inter_op_threads = min(2, len(cores))
+
+	logger.info("Drone process {} on cores {}".format(os.getpid(), cores))
+	do_drone(args)
+
+
 # --------------------------------------------------------------------------
 # Dispatch threads from main loop
 # --------------------------------------------------------------------------
 
+def start_drone(args, cores):
+	if args.drone_processes:
+		# Spawn rather than fork, the parent has TF and other threads live
+		t = multiprocessing.get_context("spawn").Process(target=do_drone_process, args=(args, cores))
+	else:
+		t = threading.Thread(target=do_drone, args=(args,))
+
+	t.daemon = True
+	t.start()
+	return t
+
+def is_alive(t):
+	return t is not None and t.is_alive()
+
 def run_main_dispatch(args):
 	my_sup = None
 	my_drones = { k:None for k in range(args.n_drones) }
+	my_cores = partition_cores(args.n_drones)
+
+	if args.drone_processes and args.queue_type == "memory":
+		raise ValueError("--drone-processes needs a queue shared between processes, not --queue-type memory")
 
 	try:
 		while True:
-			if my_sup is None or not my_sup.isAlive():
+			if not is_alive(my_sup):
 				logger.debug("Dispatch supervisor thread")
 				my_sup = threading.Thread(target=do_supervisor, args=(args,))
 				my_sup.setDaemon(True)
 				my_sup.start()
 
 			for key, drone in my_drones.items():
-				if drone is None or not drone.isAlive():
-					logger.debug("Dispatch drone thread")
-					t = threading.Thread(target=do_drone, args=(args,))
-					t.setDaemon(True)
-					t.start()
-					my_drones[key] = t
+				if not is_alive(drone):
+					if drone is not None and args.drone_processes:
+						logger.warning("Drone process {} exited with {}, restarting".format(drone.pid, drone.exitcode))
+
+					logger.debug("Dispatch drone")
+					my_drones[key] = start_drone(args, my_cores[key])
 
 			time.sleep(args.sleep_per_cycle)
 
@@ -12,3 +12,16 @@ from .singular_session_worker import SingularSessionWorker
 from .worker_test import WorkerTestCase
 from .supervisor_test import SupervisorTestCase
 from .param_test import ParamTestCase
+from .ranking_test import RankingTestCase
+from .queue_test import MemoryQueueTestCase
+from .worker_cache_test import WorkerCacheTestCase
+from .param_store_test import ParamStoreTestCase
+from .journal_test import JournalTestCase
+from .wire_test import WireTestCase
+from .run_queue_test import RunQueueTestCase
+from .schedule_test import ScheduleTestCase
+from .weight_cache_test import WeightCacheTestCase
+from .weight_bundle_test import WeightBundleTestCase
+from .chunk_store_test import ChunkStoreTestCase
+from .singular_session_worker_test import ModelSessionTestCase
+from .drone_test import DroneTestCase
@@ -0,0 +1,60 @@
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AffinityTable(object):
+	"""Which drone holds which workers and model dirs warm, from AffinitySpec adverts.
+
+	Each advert replaces that drone's previous claims. Drones not heard from
+	within max_age seconds are ignored.
+	"""
+
+	def __init__(self, max_age):
+		self.max_age = max_age
+		self.heard = {}
+		self.claims = {}
+		self.by_worker = {}
+		self.by_model = {}
+
+	def record(self, spec, now):
+		old_workers, old_models = self.claims.get(spec.drone_id, ([], []))
+
+		for i in old_workers:
+			if self.by_worker.get(i, None) == spec.drone_id:
+				del self.by_worker[i]
+
+		for i in old_models:
+			if self.by_model.get(i, None) == spec.drone_id:
+				del self.by_model[i]
+
+		for i in spec.worker_ids:
+			self.by_worker[i] = spec.drone_id
+
+		for i in spec.model_ids:
+			self.by_model[i] = spec.drone_id
+
+		self.claims[spec.drone_id] = (spec.worker_ids, spec.model_ids)
+		self.heard[spec.drone_id] = now
+
+	def _fresh(self, drone_id, now):
+		return drone_id is not None and now - self.heard.get(drone_id, 0) < self.max_age
+
+	def drone_for(self, worker, now):
+		"""The drone holding this worker, or failing that the checkpoint it warm starts from"""
+
+		drone_id = self.by_worker.get(worker.id, None)
+		if self._fresh(drone_id, now):
+			return drone_id
+
+		try:
+			model_id = worker.params["model_id"].value
+			for key in ["cur", "warm_start_from"]:
+				drone_id = self.by_model.get(model_id[key], None)
+				if self._fresh(drone_id, now):
+					return drone_id
+		except (KeyError, AttributeError, TypeError):
+			pass
+
+		return None
+
@@ -0,0 +1,125 @@
+import os
+import os.path
+import time
+import uuid
+import hashlib
+import collections
+
+import tensorflow as tf
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ChunkStore(object):
+	"""Content-addressed store of checkpoint chunks shared by a run's models.
+
+	Weight bundles saved with a store split each array into chunk_size pieces
+	named by their sha256, under <root>/<first two hex digits>/<hash>. A child
+	saved from its mentor's weights, and any variable that didn't change since
+	the last save, costs only a manifest plus an existence check per chunk.
+	Chunks are never modified, so writers can race on the same one harmlessly.
+
+	Chunks are freed by collect(), which counts references from the manifests
+	still in use and removes the unreferenced ones older than a grace period.
+	put() refreshes the mtime of a chunk that already exists, so one about to
+	be re-referenced by a manifest not yet written isn't collected meanwhile.
+	"""
+
+	dir_name = "chunks"
+
+	def __init__(self, root, chunk_size=1024*1024):
+		self.root = root
+		self.chunk_size = chunk_size
+
+	@classmethod
+	def for_run(clz, model_dir, run, chunk_size_kb=1024):
+		return clz(os.path.join(model_dir, run, clz.dir_name), chunk_size_kb * 1024)
+
+	def path(self, digest):
+		return os.path.join(self.root, digest[:2], digest)
+
+	def put(self, data):
+		digest = hashlib.sha256(data).hexdigest()
+		path = self.path(digest)
+
+		# Always check, collect() in the supervisor may have removed it since we last wrote it
+		if not (tf.gfile.Exists(path) and self.touch(path)):
+			self.write(path, data)
+
+		return digest
+
+	def write(self, path, data):
+		tf.gfile.MakeDirs(os.path.dirname(path))
+		tmp_path = path + "." + uuid.uuid4().hex + ".tmp"
+		with tf.gfile.GFile(tmp_path, "wb") as file:
+			file.write(data)
+		tf.gfile.Rename(tmp_path, path, overwrite=True)
+
+	def touch(self, path):
+		"""Refreshes path's mtime. Returns False if it must be rewritten instead"""
+		# Buckets have no utime, and the chunk may have just been collected
+		if "://" in path:
+			return False
+
+		try:
+			os.utime(path)
+			return True
+		except FileNotFoundError:
+			return False
+
+	def get(self, digest):
+		with tf.gfile.GFile(self.path(digest), "rb") as file:
+			return file.read()
+
+	def split(self, data):
+		"""Stores data and returns the list of chunk hashes to rebuild it"""
+		return [self.put(data[i : i+self.chunk_size]) for i in range(0, len(data), self.chunk_size)]
+
+	def join(self, digests):
+		return b"".join(self.get(i) for i in digests)
+
+	# --------------------------------------------------------------------------
+	# Garbage collection
+	# --------------------------------------------------------------------------
+
+	def ref_counts(self, manifests):
+		counts = collections.Counter()
+		for manifest in manifests:
+			for i in manifest.get("arrays", []):
+				counts.update(i.get("chunks", []))
+		return counts
+
+	def collect(self, manifests, grace_secs=0, now=None):
+		"""Removes chunks referenced by none of manifests and older than
+		grace_secs (so chunks a drone is about to reference survive).
+		Returns the number removed"""
+
+		now = now if now is not None else time.time()
+		counts = self.ref_counts(manifests)
+		removed = 0
+
+		if not tf.gfile.IsDirectory(self.root):
+			return 0
+
+		for prefix in tf.gfile.ListDirectory(self.root):
+			prefix_dir = os.path.join(self.root, prefix.rstrip("/"))
+
+			for name in tf.gfile.ListDirectory(prefix_dir):
+				name = name.rstrip("/")
+				if counts[name] > 0:
+					continue
+
+				path = os.path.join(prefix_dir, name)
+
+				try:
+					mtime = tf.gfile.Stat(path).mtime_nsec / 1e9
+					if now - mtime >= grace_secs:
+						tf.gfile.Remove(path)
+						removed += 1
+				except tf.errors.NotFoundError:
+					pass
+
+		logger.info("Removed {} unreferenced checkpoint chunks, {} referenced".format(removed, len(counts)))
+		return removed
+
@@ -0,0 +1,71 @@
+import unittest
+import tempfile
+import os
+import os.path
+import time
+
+import numpy as np
+
+from .chunk_store import ChunkStore
+from .weight_bundle import save_bundle, load_bundle, read_manifest
+
+class ChunkStoreTestCase(unittest.TestCase):
+
+	def count_chunks(self, store):
+		return sum(len(files) for _, _, files in os.walk(store.root))
+
+	def test_dedup(self):
+		with tempfile.TemporaryDirectory() as root:
+			store = ChunkStore(os.path.join(root, "chunks"), chunk_size=64)
+			weights = {
+				"a": np.arange(40, dtype=np.float32),
+				"b": np.ones((4, 4), dtype=np.float64),
+			}
+
+			save_bundle(os.path.join(root, "mentor"), weights, store)
+			n = self.count_chunks(store)
+
+			# A freshly warm started child adds no chunks
+			save_bundle(os.path.join(root, "child"), weights, store)
+			self.assertEqual(self.count_chunks(store), n)
+
+			loaded = load_bundle(os.path.join(root, "child"), store)
+			for k, v in weights.items():
+				np.testing.assert_array_equal(loaded[k], v)
+
+	def test_collect(self):
+		with tempfile.TemporaryDirectory() as root:
+			store = ChunkStore(os.path.join(root, "chunks"), chunk_size=64)
+
+			save_bundle(os.path.join(root, "live"), {"w": np.zeros(16)}, store)
+			save_bundle(os.path.join(root, "dead"), {"w": np.arange(16.0)}, store)
+			live = read_manifest(os.path.join(root, "live"))
+
+			# Too recent to remove
+			self.assertEqual(store.collect([live], grace_secs=60), 0)
+
+			self.assertEqual(store.collect([live], grace_secs=60, now=time.time() + 120), 2)
+			np.testing.assert_array_equal(load_bundle(os.path.join(root, "live"), store)["w"], np.zeros(16))
+
+	def test_put_refreshes_unreferenced(self):
+		with tempfile.TemporaryDirectory() as root:
+			store = ChunkStore(os.path.join(root, "chunks"), chunk_size=64)
+			old = time.time() - 120
+
+			save_bundle(os.path.join(root, "dead"), {"w": np.arange(16.0)}, store)
+			for dirpath, _, files in os.walk(store.root):
+				for name in files:
+					os.utime(os.path.join(dirpath, name), (old, old))
+
+			# A drone reuses the dead model's chunks, but collect runs
+			# before its manifest is renamed into place
+			digests = store.split(np.arange(16.0).tobytes())
+			self.assertEqual(store.collect([], grace_secs=60), 0)
+
+			self.assertEqual(store.join(digests), np.arange(16.0).tobytes())
+			self.assertEqual(store.collect([], grace_secs=60, now=time.time() + 120), 2)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,38 @@
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CreditTable(object):
+	"""Run slots drones have advertised with CreditSpec.
+
+	Each advert replaces that drone's previous one. Heartbeats from a drone
+	keep its slots alive while it is busy training. Drones heard from neither
+	way within max_age seconds count as gone.
+	"""
+
+	def __init__(self, max_age):
+		self.max_age = max_age
+		self.slots = {}
+		self.heard = {}
+
+	def __len__(self):
+		return len(self.slots)
+
+	def record(self, spec, now):
+		self.slots[spec.drone_id] = spec.slots
+		self.heard[spec.drone_id] = now
+
+	def touch(self, drone_id, now):
+		if drone_id in self.slots:
+			self.heard[drone_id] = now
+
+	def capacity(self, now):
+		"""Total slots of live drones"""
+		for drone_id in [k for k, v in self.heard.items() if now - v >= self.max_age]:
+			logger.info("Drone {} stopped advertising credit".format(drone_id))
+			del self.heard[drone_id]
+			del self.slots[drone_id]
+
+		return sum(self.slots.values())
+
@@ -0,0 +1,45 @@
+
+import heapq
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DeadlineQueue(object):
+	"""Min-heap of per-key deadlines with lazy invalidation.
+
+	Each key has at most one live deadline. Rescheduling or discarding a key
+	leaves its old heap entry in place; it is recognised as stale and dropped
+	when it reaches the top, so updates are O(log n) and never scan the heap.
+	"""
+
+	def __init__(self):
+		self.heap = []
+		self.deadlines = {}
+
+	def __len__(self):
+		return len(self.deadlines)
+
+	def __contains__(self, key):
+		return key in self.deadlines
+
+	def schedule(self, key, deadline):
+		self.deadlines[key] = deadline
+		heapq.heappush(self.heap, (deadline, key))
+
+	def discard(self, key):
+		self.deadlines.pop(key, None)
+
+	def pop_expired(self, now):
+		"""Removes and returns the keys whose deadline is <= now"""
+		expired = []
+
+		while len(self.heap) > 0 and self.heap[0][0] <= now:
+			deadline, key = heapq.heappop(self.heap)
+
+			if self.deadlines.get(key, None) == deadline:
+				del self.deadlines[key]
+				expired.append(key)
+
+		return expired
+
@@ -6,7 +6,7 @@ import time
 import collections
 import platform
 import uuid
-import random
+import threading
 import petname
 
 import logging
@@ -15,30 +15,153 @@ logger = logging.getLogger(__name__)
 # Hack for single-threaded
 from .google_pubsub_thread import Policy
 from .specs import *
-from .queue import QueueFactory
+from .queue import QueueFactory, MAX_PRIORITY
+from .param_store import ParamStore
+from .worker_cache import WorkerCache
 
 Perf = collections.namedtuple('Perf', ['time_start', 'time_end', 'steps'])
 
+class RunMonitor(threading.Thread):
+	"""Holds the supervisor's lease on the drone's current run, off the training thread.
+
+	One monitor lives as long as its drone, so it reuses a single pooled
+	broker connection rather than opening one per run. begin() and end()
+	tell it which run, if any, is in progress.
+
+	While a run is in progress it sends a heartbeat every job_timeout/6, which
+	claims or renews the lease, and every --cancel-poll-secs it reads the
+	supervisor's LeaseSpecs. The supervisor also revokes leases unprompted,
+	when it culls or supersedes a running worker. If the lease is revoked, or
+	not renewed for job_timeout (by which time the supervisor will have
+	redispatched), it sets `cancelled`. The training loop only checks that
+	flag, so it never blocks on the broker, and a slow step can't delay
+	heartbeats.
+	"""
+
+	def __init__(self, drone):
+		super().__init__(daemon=True)
+		self.drone = drone
+		self.interval = drone.args.job_timeout / 6
+		self.poll_interval = min(drone.args.cancel_poll_secs, self.interval) if drone.args.cancel_poll_secs > 0 else self.interval
+
+		self.lock = threading.Lock()
+		self.worker = None
+		self.run_spec = None
+		self.lease_expires = 0
+		self.time_next_beat = 0
+
+		self.cancelled = threading.Event()
+		self.stopping = threading.Event()
+		self.wake = threading.Event()
+
+	def begin(self, worker, run_spec):
+		with self.lock:
+			self.worker = worker
+			self.run_spec = run_spec
+			self.lease_expires = time.time() + self.drone.args.job_timeout
+
+			# First beat straight away so the supervisor knows the run was picked up
+			self.time_next_beat = 0
+			self.cancelled.clear()
+
+		self.wake.set()
+
+	def end(self):
+		with self.lock:
+			self.worker = None
+			self.run_spec = None
+
+	def _handle_lease(self, spec):
+		with self.lock:
+			# Replies about earlier runs are stale, drop them
+			if self.run_spec is None or spec.run_id != self.run_spec.id:
+				return
+
+			if spec.granted:
+				self.lease_expires = max(self.lease_expires, spec.expires)
+			else:
+				self.drone.logger.info("{} lease for run {} revoked".format(spec.worker_id, spec.run_id))
+				self.cancelled.set()
+
+	def check(self):
+		"""Heartbeat if due and check the lease. Returns seconds until the next check"""
+		with self.lock:
+			worker, run_spec = self.worker, self.run_spec
+
+		if run_spec is None:
+			return self.interval
+
+		if time.time() >= self.time_next_beat:
+			self.drone._send_heartbeat(worker, run_spec)
+			self.time_next_beat = time.time() + self.interval
+
+		self.drone.queue_lease.get_messages(lambda spec, ack, nack: self._handle_lease(spec))
+
+		with self.lock:
+			if self.run_spec is run_spec and time.time() > self.lease_expires and not self.cancelled.is_set():
+				self.drone.logger.info("{} lease for run {} expired".format(worker.id, run_spec.id))
+				self.cancelled.set()
+
+		return min(self.poll_interval, max(self.time_next_beat - time.time(), 0))
+
+	def run(self):
+		try:
+			while not self.stopping.is_set():
+				try:
+					wait = self.check()
+				except Exception:
+					# Losing heartbeats just means the supervisor may redispatch, keep training
+					traceback.print_exc()
+					wait = self.poll_interval
+
+				self.wake.wait(wait)
+				self.wake.clear()
+
+		finally:
+			# Release this thread's pooled broker connection
+			self.drone.queue_lease.close()
+
+	def should_continue(self):
+		if self.cancelled.is_set():
+			raise StopIteration()
+		return True
+
+	def stop(self):
+		self.stopping.set()
+		self.wake.set()
+		self.join()
+
 class Drone(object):
 	
 	def __init__(self, args, SubjectClass, init_params):
 		self.args = args
 		self.SubjectClass = SubjectClass
 		self.init_params = init_params
-		self.worker_cache = {}
-		self.run_max = {}
+		self.worker_cache = WorkerCache(args.drone_cache_size, args.drone_cache_rss_mb)
 		self.drone_id = petname.Generate(3, '-') #uuid.uuid1()
 
 		self.logger = logging.getLogger(__name__ + "." + self.drone_id)
 
 		self.performance = []
 		self.steps_per_sec = 0
-		self.time_last_heartbeat = 0
-		self.time_last_token_check = 0
+		self.time_last_advert = 0
+		self.time_last_credit = 0
+		self.n_mine_streak = 0
+
+		self.queue_result = QueueFactory.vend(self.args, "result", "result_shared", "result", types=[])
+		self.queue_lease = QueueFactory.vend(self.args, "lease", "lease_"+self.drone_id, "lease."+self.drone_id, types=["lease"])
+		self.queue_run = QueueFactory.vend(self.args, "run", "run_shared", "run", types=["run"],
+			max_priority=MAX_PRIORITY if self.args.priority_dispatch else None)
 
-		self.queue_result = QueueFactory.vend(self.args, "result", "result_shared", "result")
-		self.queue_heartbeat = QueueFactory.vend(self.args, "result", str(self.drone_id), "heartbeat")
-		self.queue_run = QueueFactory.vend(self.args, "run", "run_shared", "run")
+		if self.args.affinity_dispatch:
+			self.queue_run_mine = QueueFactory.vend(self.args, "run", "run_"+self.drone_id, "run."+self.drone_id, types=["run"])
+		else:
+			self.queue_run_mine = None
+
+		self.param_store = ParamStore(self.args)
+
+		self.monitor = RunMonitor(self)
+		self.monitor.start()
 
 
 	def _send_result(self, run_spec, worker, success):
@@ -51,63 +174,94 @@ class Drone(object):
 			run_spec.micro_step,
 			worker.recent_steps,
 			worker.total_steps, 
-			worker.params,
-			time.time())
+			# The supervisor already holds the params, only echo them if it's not using the store
+			worker.params if run_spec.params_hash is None and self.queue_result.passes_objects else None,
+			time.time(),
+			run_spec.id,
+			worker.secs_per_step)
 
 		self.queue_result.send(result_spec)
 
-	def _send_heartbeat(self, worker, run_spec, tiebreaker):
-		if time.time() - self.time_last_heartbeat > self.args.job_timeout / 6:
-			spec = HeartbeatSpec(
-				self.args.run, 
-				platform.node(),
-				run_spec.id,
-				worker.id, 
-				tiebreaker, 
-				worker.total_steps,
-				time.time())
-
-			self.queue_heartbeat.send(spec)
-			self.time_last_heartbeat = time.time()
-
-	def _handle_heartbeat(self, spec):
-		cur = self.run_max.get(spec.worker_id, 0)
-		self.run_max[spec.worker_id] = max(cur, spec.total_steps + spec.tiebreaker)
-
-	def _should_continue(self, worker, run_spec, tiebreaker):
-		if time.time() - self.time_last_token_check > self.args.job_timeout / 6:
-			self.queue_heartbeat.get_messages(lambda m, ack, nack: self._handle_heartbeat(m))
-			self.time_last_token_check = time.time()
+	def _send_heartbeat(self, worker, run_spec):
+		spec = HeartbeatSpec(
+			self.args.run, 
+			platform.node(),
+			run_spec.id,
+			worker.id, 
+			self.drone_id, 
+			worker.total_steps,
+			time.time())
 
-		try:
-			should = self.run_max[run_spec.worker_id] <= tiebreaker + worker.total_steps
-			if not should:
-				self.queue_result.send(GiveUpSpec(
-					self.args.run,
-					platform.node(),
-					time.time(),
-					run_spec.id,
-					worker.id					
-				))
-				self.logger.info("Should not continue, heard another heartbeat with higher run")
-				raise StopIteration()
-			
-		except KeyError:
-			pass
+		self.queue_result.send(spec)
 
-		return True
+	def _send_advert(self):
+		"""Tell the supervisor which workers and checkpoints we have warm"""
+
+		model_ids = []
+		for worker in self.worker_cache.values():
+			try:
+				model_ids.append(worker.friendly_params["model_id"]["cur"])
+			except Exception:
+				pass
+
+		spec = AffinitySpec(
+			self.args.run,
+			platform.node(),
+			self.drone_id,
+			list(self.worker_cache.keys()),
+			model_ids,
+			time.time())
 
+		self.queue_result.send(spec)
+		self.time_last_advert = time.time()
+
+	def _send_credit(self):
+		"""Tell the supervisor we can take another run"""
+
+		# Drones train one run at a time
+		spec = CreditSpec(
+			self.args.run,
+			platform.node(),
+			self.drone_id,
+			1,
+			time.time())
+
+		self.queue_result.send(spec)
+		self.time_last_credit = time.time()
+
+	def _send_failure(self, run_spec):
+		"""Failed result for a run that never got a worker, e.g. its params couldn't be fetched"""
+		self.queue_result.send(ResultSpec(
+			self.args.run, 
+			run_spec.worker_id, 
+			platform.node(),
+			None, 
+			False, 
+			run_spec.micro_step,
+			run_spec.recent_steps,
+			run_spec.total_steps, 
+			None,
+			time.time(),
+			run_spec.id,
+			None))
 
 	def _handle_run(self, run_spec):
 
-		if run_spec.worker_id in self.worker_cache:
-			worker = self.worker_cache[run_spec.worker_id]
-		else:
-			worker = self.SubjectClass(self.init_params, run_spec.params)
-			worker.id = run_spec.worker_id
-			self.worker_cache[run_spec.worker_id] = worker
+		try:
+			if run_spec.params is None:
+				run_spec = run_spec._replace(params=self.param_store.get(run_spec.params_hash))
 
-		worker.update_from_run_spec(run_spec)
+			worker = self.worker_cache.get(run_spec.worker_id)
+			if worker is None:
+				worker = self.SubjectClass(self.init_params, run_spec.params)
+				worker.id = run_spec.worker_id
+				self.worker_cache.put(run_spec.worker_id, worker)
+
+			worker.update_from_run_spec(run_spec)
+		except Exception:
+			traceback.print_exc()
+			self._send_failure(run_spec)
+			return
 
 		# Good idea, bad impl
 		# Stop multiple workers over-writing eachother's saves
@@ -117,25 +271,32 @@ class Drone(object):
 			time_start = time.time()
 			self.logger.info("{}.step_and_eval({}, {})".format(run_spec.worker_id, run_spec.macro_step, run_spec.micro_step))
 			
-			self.time_last_heartbeat = 0
-			self.time_last_token_check = 0
-			tiebreaker = random.random()
+			monitor = self.monitor
+			monitor.begin(worker, run_spec)
 
-			send_heartbeat  = lambda:self._send_heartbeat(worker, run_spec, tiebreaker)
-			should_continue = lambda:self._should_continue(worker, run_spec, tiebreaker)
+			# Heartbeats are sent by the monitor thread
+			send_heartbeat  = lambda:None
+			should_continue = monitor.should_continue
 
 			try:
 				for i in range(run_spec.macro_step):
 					worker.step_and_eval(run_spec.micro_step, send_heartbeat, should_continue)
 					self._send_result(run_spec, worker, True)
 			except StopIteration:
-				pass
+				# Acknowledge with whatever we had at the last eval
+				self.logger.info("{} run {} cancelled at {} total steps".format(worker.id, run_spec.id, worker.total_steps))
+				self._send_result(run_spec, worker, True)
+			finally:
+				monitor.end()
 
 			self.performance.append(Perf(time_start, time.time(), run_spec.micro_step * run_spec.macro_step))
 			self.print_performance()
 		except Exception as e:
 			traceback.print_exc()
 			self._send_result(run_spec, worker, False)
+
+		# Sessions grow while training, so check the memory bound again
+		self.worker_cache.trim()
 		
 
 	def print_performance(self):
@@ -153,18 +314,57 @@ class Drone(object):
 			self.steps_per_sec = steps / duration
 			self.logger.info("Steps per second: {}".format(self.steps_per_sec))
 
+		self.logger.info("Worker cache: {}".format(self.worker_cache.stats))
+
 
 
 	def get_messages(self):
-		self.queue_run.get_messages(lambda data, ack, nack: self._handle_run(data), 1)
+		handled = []
+
+		def handle(data, ack, nack):
+			handled.append(data)
+			self._handle_run(data)
+
+		# Runs routed to us because we have their worker warm come first, but
+		# after --affinity-streak of them in a row the shared queue gets a turn.
+		# Otherwise a drone whose own queue is always refilled by its last run
+		# would never reach the workers no drone has warm
+		queues = [self.queue_run]
+		if self.queue_run_mine is not None:
+			if self.n_mine_streak < self.args.affinity_streak:
+				queues.insert(0, self.queue_run_mine)
+			else:
+				queues.append(self.queue_run_mine)
+
+		for queue in queues:
+			queue.get_messages(handle, 1)
+			if len(handled) > 0:
+				self.n_mine_streak = self.n_mine_streak + 1 if queue is self.queue_run_mine else 0
+				break
+
+		if self.args.affinity_dispatch and (len(handled) > 0 or time.time() - self.time_last_advert > self.args.job_timeout / 6):
+			self._send_advert()
+
+		# Straight after a run we're free again, otherwise refresh before it lapses
+		if self.args.flow_control and (len(handled) > 0 or time.time() - self.time_last_credit > self.args.job_timeout / 6):
+			self._send_credit()
 		
 
 	def run_epoch(self):
 		self.get_messages()
 
 	def close(self):
+		self.monitor.stop()
+
+		for key in list(self.worker_cache.keys()):
+			self.worker_cache.evict(key)
+
 		self.queue_run.close()
 		self.queue_result.close()
+		self.queue_lease.close()
+
+		if self.queue_run_mine is not None:
+			self.queue_run_mine.close()
 
 
 
@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+import shutil
+import uuid
+import time
+
+from .drone import Drone
+from .specs import RunSpec
+from .queue import QueueFactory
+from .mock import MockWorker
+
+class DroneArgs(object):
+	def __init__(self, run, output_dir):
+		self.run = run
+		self.output_dir = output_dir
+		self.bucket = None
+		self.gcs_dir = None
+		self.queue_type = "memory"
+		self.wire_format = "compact"
+		self.accept_pickle = False
+		self.message_timeout = 60
+		self.job_timeout = 60
+		self.cancel_poll_secs = 5
+		self.drone_cache_size = 0
+		self.drone_cache_rss_mb = 0
+		self.priority_dispatch = False
+		self.flow_control = False
+		self.affinity_dispatch = True
+		self.affinity_streak = 1
+
+class RecordingDrone(Drone):
+	"""Records the runs it's handed instead of training them"""
+
+	def __init__(self, *argv):
+		super().__init__(*argv)
+		self.handled = []
+
+	def _handle_run(self, run_spec):
+		self.handled.append(run_spec.worker_id)
+
+class DroneTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def run_spec(self, args, worker_id):
+		return RunSpec(uuid.uuid4(), args.run, worker_id, "host", None, 0, 0, 1, 1, time.time(), "hash", None)
+
+	def test_affinity_shares_turns(self):
+		args = DroneArgs("drone_test_affinity", self.dir)
+		drone = RecordingDrone(args, MockWorker, {})
+
+		try:
+			# More workers than drones: some are warm here, the rest in nobody's cache
+			mine = QueueFactory.vend(args, "run", "run_"+drone.drone_id, "run."+drone.drone_id, types=["run"])
+			shared = QueueFactory.vend(args, "run", "run_shared", "run", types=["run"])
+
+			for i in range(3):
+				mine.send(self.run_spec(args, "warm" + str(i)))
+			for i in range(2):
+				shared.send(self.run_spec(args, "cold" + str(i)))
+
+			for i in range(5):
+				drone.get_messages()
+
+		finally:
+			drone.close()
+
+		self.assertEqual(drone.handled, ["warm0", "cold0", "warm1", "cold1", "warm2"])
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,169 @@
+
+import os
+import os.path
+import time
+import pickle
+
+import logging
+logger = logging.getLogger(__name__)
+
+from util import FileWritey, FileReadie
+
+
+# Worker attributes that change after the worker is added, besides its results
+UPDATE_FIELDS = ["time_last_updated", "secs_per_step", "run_steps", "lease_run_id", "lease_drone_id"]
+
+
+class PopulationJournal(object):
+	"""Append-only log of population changes, with periodic compacted snapshots.
+
+	Records are appended as consecutive pickles to workers.journal:
+		("add",    worker_header)
+		("del",    worker_id)
+		("update", worker_id, total_steps, recent_steps, results, fields)
+
+	where fields is a dict of the other attributes in UPDATE_FIELDS (records
+	from before it existed have no fields and replay without them).
+
+	compact() writes the whole population to workers.pkl (the same snapshot the
+	non-journaled Supervisor.save writes) and truncates the log. Replaying is
+	idempotent, so a crash between the snapshot and the truncate is harmless.
+	"""
+
+	journal_filename = "workers.journal"
+	snapshot_filename = "workers.pkl"
+
+	def __init__(self, args):
+		self.args = args
+		self.file = None
+		self.time_last_compact = time.time()
+		self.records_since_compact = 0
+
+	@property
+	def file_path(self):
+		return os.path.join(self.args.output_dir, self.args.run, self.journal_filename)
+
+	def _open(self, mode):
+		if self.file is not None:
+			self.file.close()
+
+		os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+		self.file = open(self.file_path, mode)
+
+	# --------------------------------------------------------------------------
+	# Writing
+	# --------------------------------------------------------------------------
+
+	def reset(self):
+		"""Start a fresh journal, discarding any previous one"""
+		self._open("wb")
+		self.records_since_compact = 0
+
+	def append(self, *record):
+		if self.file is None:
+			self._open("ab")
+
+		pickle.dump(record, self.file, pickle.HIGHEST_PROTOCOL)
+		self.records_since_compact += 1
+
+	def add(self, worker):
+		self.append("add", worker)
+
+	def delete(self, worker_id):
+		self.append("del", worker_id)
+
+	def update(self, worker):
+		fields = {k: getattr(worker, k, None) for k in UPDATE_FIELDS}
+		self.append("update", worker.id, worker.total_steps, worker.recent_steps, worker.results, fields)
+
+	def flush(self):
+		"""Make the journal durable locally and copy it to the bucket if configured"""
+		if self.file is not None:
+			self.file.flush()
+			os.fsync(self.file.fileno())
+			FileWritey(self.args, self.journal_filename, True).copy_to_bucket()
+
+	def consider_compact(self, workers):
+		if time.time() - self.time_last_compact > self.args.journal_compact_secs and self.records_since_compact > 0:
+			self.compact(workers)
+
+	def compact(self, workers):
+		logger.debug("Compacting journal of {} records".format(self.records_since_compact))
+
+		with FileWritey(self.args, self.snapshot_filename, True) as file:
+			pickle.dump(workers, file)
+
+		self.reset()
+		self.flush()
+		self.time_last_compact = time.time()
+
+	# --------------------------------------------------------------------------
+	# Reading
+	# --------------------------------------------------------------------------
+
+	def replay(self, workers, file):
+		n = 0
+
+		while True:
+			try:
+				record = pickle.load(file)
+			except EOFError:
+				break
+			except Exception:
+				# A partially written final record, e.g. we crashed mid-append
+				logger.warning("Truncated journal after {} records".format(n))
+				break
+
+			kind = record[0]
+
+			if kind == "add":
+				workers[record[1].id] = record[1]
+
+			elif kind == "del":
+				workers.pop(record[1], None)
+
+			elif kind == "update":
+				worker_id, total_steps, recent_steps, results = record[1:5]
+				fields = record[5] if len(record) > 5 else {}
+				if worker_id in workers:
+					w = workers[worker_id]
+					w.total_steps = total_steps
+					w.recent_steps = recent_steps
+					w.results = results
+					for k, v in fields.items():
+						setattr(w, k, v)
+
+			else:
+				logger.warning("Unknown journal record {}".format(kind))
+
+			n += 1
+
+		return n
+
+	def load(self):
+		"""Returns workers dict rebuilt from the last snapshot plus the journal"""
+
+		try:
+			with FileReadie(self.args, self.snapshot_filename, True) as file:
+				workers = pickle.load(file)
+		except FileNotFoundError:
+			workers = {}
+
+		try:
+			with FileReadie(self.args, self.journal_filename, True) as file:
+				n = self.replay(workers, file)
+				logger.info("Replayed {} journal records".format(n))
+		except FileNotFoundError:
+			pass
+
+		# Fold what we replayed into a fresh snapshot so the journal starts empty
+		self.compact(workers)
+
+		return workers
+
+	def close(self):
+		if self.file is not None:
+			self.flush()
+			self.file.close()
+			self.file = None
+
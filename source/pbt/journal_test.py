@@ -0,0 +1,140 @@
+import unittest
+import os
+import pickle
+import os.path
+import shutil
+import tempfile
+
+from .journal import PopulationJournal
+from .specs import WorkerHeader
+
+class JournalArgs(object):
+	def __init__(self, output_dir):
+		self.output_dir = output_dir
+		self.run = "journal_test"
+		self.bucket = None
+		self.gcs_dir = None
+		self.journal_compact_secs = 60
+
+class JournalTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.args = JournalArgs(self.dir)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def population(self, journal):
+		workers = {}
+		for i in range(3):
+			w = WorkerHeader({"i": i})
+			workers[w.id] = w
+			journal.add(w)
+		return workers
+
+	def test_append_load(self):
+		journal = PopulationJournal(self.args)
+		journal.reset()
+		workers = self.population(journal)
+		a, b, c = workers.values()
+
+		a.total_steps = 10
+		a.recent_steps = 10
+		a.results = {"score": 0.5}
+		a.time_last_updated = 123.0
+		a.secs_per_step = 0.25
+		a.run_steps = 40
+		a.lease_run_id = "run-a"
+		a.lease_drone_id = "drone-a"
+		journal.update(a)
+		journal.delete(b.id)
+		journal.close()
+
+		loaded = PopulationJournal(self.args).load()
+
+		self.assertEqual(set(loaded.keys()), set([a.id, c.id]))
+		la = loaded[a.id]
+		self.assertEqual((la.total_steps, la.recent_steps, la.results), (10, 10, {"score": 0.5}))
+		self.assertEqual(la.time_last_updated, 123.0)
+		self.assertEqual(la.secs_per_step, 0.25)
+		self.assertEqual(la.run_steps, 40)
+		self.assertEqual((la.lease_run_id, la.lease_drone_id), ("run-a", "drone-a"))
+
+	def test_old_update_record(self):
+		journal = PopulationJournal(self.args)
+		journal.reset()
+		workers = self.population(journal)
+		a = next(iter(workers.values()))
+
+		# Written before updates carried their other fields
+		journal.append("update", a.id, 5, 5, {"score": 0.1})
+		journal.close()
+
+		la = PopulationJournal(self.args).load()[a.id]
+		self.assertEqual((la.total_steps, la.results), (5, {"score": 0.1}))
+		self.assertIsNone(la.lease_run_id)
+
+	def test_truncated_last_record(self):
+		journal = PopulationJournal(self.args)
+		journal.reset()
+		workers = self.population(journal)
+		a = next(iter(workers.values()))
+		a.total_steps = 7
+		journal.update(a)
+		journal.close()
+
+		# Crash part way through appending the update
+		size = os.path.getsize(journal.file_path)
+		with open(journal.file_path, "r+b") as file:
+			file.truncate(size - 5)
+
+		loaded = PopulationJournal(self.args).load()
+
+		self.assertEqual(set(loaded.keys()), set(workers.keys()))
+		self.assertEqual(loaded[a.id].total_steps, 0)
+
+	def test_compact_idempotent(self):
+		journal = PopulationJournal(self.args)
+		journal.reset()
+		workers = self.population(journal)
+		a = next(iter(workers.values()))
+		a.total_steps = 3
+		journal.update(a)
+
+		journal.compact(workers)
+		journal.compact(workers)
+		journal.close()
+
+		once = PopulationJournal(self.args).load()
+		twice = PopulationJournal(self.args).load()
+
+		self.assertEqual(set(once.keys()), set(workers.keys()))
+		self.assertEqual(set(twice.keys()), set(workers.keys()))
+		self.assertEqual(twice[a.id].total_steps, 3)
+		self.assertEqual(os.path.getsize(journal.file_path), 0)
+
+	def test_crash_between_snapshot_and_truncate(self):
+		journal = PopulationJournal(self.args)
+		journal.reset()
+		workers = self.population(journal)
+		a, b, c = workers.values()
+		a.total_steps = 3
+		journal.update(a)
+		journal.delete(b.id)
+		del workers[b.id]
+		journal.close()
+
+		# The snapshot made it to disk but the journal was never truncated
+		with open(os.path.join(self.dir, self.args.run, journal.snapshot_filename), "wb") as file:
+			pickle.dump(workers, file)
+
+		loaded = PopulationJournal(self.args).load()
+
+		self.assertEqual(set(loaded.keys()), set([a.id, c.id]))
+		self.assertEqual(loaded[a.id].total_steps, 3)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
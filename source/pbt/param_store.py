@@ -0,0 +1,72 @@
+
+import os.path
+import copy
+import pickle
+import hashlib
+import collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+from util import FileWritey, FileReadie
+
+
+class ParamStore(object):
+	"""Content-addressed store of ParamSets, so specs can carry a hash instead.
+
+	Tiers, fastest first: an in-memory LRU, the local output dir, then the
+	bucket (when --bucket and --gcs-dir are set). Anything fetched from the
+	bucket is left on local disk, so each drone downloads a ParamSet once.
+	"""
+
+	def __init__(self, args, max_cached=256):
+		self.args = args
+		self.max_cached = max_cached
+		self.cache = collections.OrderedDict()
+
+	def filename(self, key):
+		return os.path.join("params", key + ".pkl")
+
+	def local_path(self, key):
+		return os.path.join(self.args.output_dir, self.args.run, self.filename(key))
+
+	def _remember(self, key, params):
+		self.cache[key] = params
+		self.cache.move_to_end(key)
+
+		while len(self.cache) > self.max_cached:
+			self.cache.popitem(last=False)
+
+	def put(self, params):
+		"""Stores params and returns their hash"""
+		data = pickle.dumps(params, pickle.HIGHEST_PROTOCOL)
+		key = hashlib.sha256(data).hexdigest()
+
+		if key not in self.cache:
+			if not os.path.exists(self.local_path(key)):
+				with FileWritey(self.args, self.filename(key), True) as file:
+					file.write(data)
+
+			self._remember(key, params)
+
+		return key
+
+	def get(self, key):
+		"""Returns a copy of the ParamSet stored under key; raises FileNotFoundError if unknown"""
+		if key in self.cache:
+			self.cache.move_to_end(key)
+
+		else:
+			if os.path.exists(self.local_path(key)):
+				with open(self.local_path(key), "rb") as file:
+					params = pickle.load(file)
+			else:
+				logger.debug("Fetching params {} from bucket".format(key))
+				with FileReadie(self.args, self.filename(key), True) as file:
+					params = pickle.load(file)
+
+			self._remember(key, params)
+
+		# Workers may change their params in place, don't let that leak between them
+		return copy.deepcopy(self.cache[key])
+
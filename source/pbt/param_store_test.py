@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+import io
+import os.path
+import shutil
+import tempfile
+
+from .param_store import ParamStore
+
+class StoreArgs(object):
+	def __init__(self, output_dir):
+		self.output_dir = output_dir
+		self.run = "param_store_test"
+		self.bucket = None
+		self.gcs_dir = None
+
+class ParamStoreTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.dirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+
+	def tearDown(self):
+		for i in self.dirs:
+			shutil.rmtree(i)
+
+	def test_round_trip(self):
+		store = ParamStore(StoreArgs(self.dirs[0]))
+		params = {"lr": 0.1, "layers": [1, 2]}
+		key = store.put(params)
+
+		self.assertEqual(store.get(key), params)
+		self.assertTrue(os.path.exists(store.local_path(key)))
+
+		# Each get is a copy, so workers can't change each other's params
+		store.get(key)["lr"] = 1.0
+		store.get(key)["layers"].append(3)
+		self.assertEqual(store.get(key), params)
+
+		# A fresh store (e.g. another drone on this host) reads it from disk
+		self.assertEqual(ParamStore(StoreArgs(self.dirs[0])).get(key), params)
+
+	def test_hash_stable(self):
+		a = ParamStore(StoreArgs(self.dirs[0]))
+		b = ParamStore(StoreArgs(self.dirs[1]))
+
+		self.assertEqual(a.put({"lr": 0.1}), b.put({"lr": 0.1}))
+		self.assertEqual(a.put({"lr": 0.1}), a.put({"lr": 0.1}))
+		self.assertNotEqual(a.put({"lr": 0.1}), a.put({"lr": 0.2}))
+
+	def test_lru_bound(self):
+		store = ParamStore(StoreArgs(self.dirs[0]), max_cached=2)
+		keys = [store.put({"i": i}) for i in range(3)]
+
+		self.assertEqual(list(store.cache.keys()), keys[1:])
+
+		# Evicted params are still on disk
+		self.assertEqual(store.get(keys[0]), {"i": 0})
+		self.assertEqual(list(store.cache.keys()), [keys[2], keys[0]])
+
+	def test_bucket_fallback(self):
+		writer = ParamStore(StoreArgs(self.dirs[0]))
+		key = writer.put({"lr": 0.1})
+
+		with open(writer.local_path(key), "rb") as file:
+			bucket = {writer.filename(key): file.read()}
+
+		def bucket_readie(args, filename, binary=False):
+			if filename not in bucket:
+				raise FileNotFoundError(filename)
+			return io.BytesIO(bucket[filename])
+
+		# Another host: nothing local, so it has to come from the bucket
+		reader = ParamStore(StoreArgs(self.dirs[1]))
+		with mock.patch("pbt.param_store.FileReadie", side_effect=bucket_readie) as readie:
+			self.assertEqual(reader.get(key), {"lr": 0.1})
+			self.assertEqual(readie.call_count, 1)
+
+			# Cached from then on
+			reader.get(key)
+			self.assertEqual(readie.call_count, 1)
+
+			with self.assertRaises(FileNotFoundError):
+				reader.get("0" * 64)
+
+	def test_unknown_without_bucket(self):
+		store = ParamStore(StoreArgs(self.dirs[0]))
+		with self.assertRaises(FileNotFoundError):
+			store.get("0" * 64)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
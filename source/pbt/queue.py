@@ -3,22 +3,73 @@ from google.cloud import pubsub_v1
 import traceback
 import pickle
 import time
+import os
+import copy
+import threading
+import collections
 
 import logging
 logger = logging.getLogger(__name__)
 
 from .google_pubsub_thread import Policy
+from . import wire
 import pika
 
+# Range of priorities used by --priority-dispatch
+MAX_PRIORITY = 10
+
+
+def message_type(message):
+	"""Routing name of a spec, e.g. HeartbeatSpec -> heartbeat"""
+	name = type(message).__name__.lower()
+	if name.endswith("spec"):
+		name = name[:-len("spec")]
+	return name
+
+
 class Queue(object):
+	"""
+		Messages are published with routing key <run>.<topic>.<type>. A queue
+		is bound to <run>.<topic>.<t> for each of its `types`, or to every type
+		if None, so the broker only delivers traffic for this run that the
+		consumer will handle. Publish-only senders pass types=[] so no queue is
+		declared or bound for them.
+
+		Queues vended with max_priority deliver messages sent with a higher
+		priority (0 to max_priority) first.
+	"""
 
 	def __init__(self, args, logger):
 		self.args = args
 		self.logger = logger
 
-	def send(self, message):
+	def _routing(self, exchange, queue, topic, types):
+		self.topic    = self.args.run + "." + topic
+		self.queue    = self.args.run + "." + queue
+		self.exchange = self.args.run + "." + exchange
+
+		if types is None:
+			self.bindings = (self.topic + ".*",)
+		else:
+			self.bindings = tuple(self.topic + "." + t for t in types)
+
+	def routing_key(self, message):
+		return self.topic + "." + message_type(message)
+
+	def send(self, message, priority=None):
 		pass
 
+	@property
+	def passes_objects(self):
+		"""True if specs arrive with arbitrary objects (e.g. params) intact,
+		otherwise params must travel by their param store hash"""
+		return self.args.wire_format == "pickle"
+
+	def encode(self, message):
+		if self.args.wire_format == "compact":
+			return wire.encode(message)
+		return pickle.dumps(message)
+
 	def get_messages(self, callback):
 		"""
 			callback: (spec, ack, nack) -> None
@@ -27,17 +78,61 @@ class Queue(object):
 		pass
 
 	def _handle_message(self, data, callback, ack, nack):
-		try:
-			spec = pickle.loads(data)
-		except Exception:
-			logger.debug("Could not unpickle message")
+		if wire.is_wire(data):
+			try:
+				header = wire.peek_header(data)
+			except Exception:
+				logger.debug("Could not read message header")
+				ack()
+				return
+
+			# Drop foreign and expired messages before decoding the body
+			if not self._should_handle(header, ack, nack):
+				return
+
+			try:
+				spec = wire.decode(data, header)
+			except Exception:
+				logger.debug("Could not decode message")
+				ack()
+				return
+
+		elif self.args.wire_format == "pickle" or self.args.accept_pickle:
+			try:
+				spec = pickle.loads(data)
+			except Exception:
+				logger.debug("Could not unpickle message")
+				ack()
+				return
+
+		else:
+			# Unpickling runs whatever the sender likes, so only when asked to
+			self.logger.warning("Dropped message not in the wire format, see --accept-pickle")
 			ack()
 			return
 
+		self._handle_spec(spec, callback, ack, nack)
+
+	def _should_handle(self, header, ack, nack):
+		if time.time() - header.time_sent >= self.args.message_timeout:
+			self.logger.debug("Timed out message")
+			ack()
+			return False
+
+		if header.group != self.args.run:
+			# The broker only routes this run's messages here, so nobody
+			# listening on this queue wants it. Requeueing would just spin.
+			self.logger.debug("Message for other group {}".format(header.group))
+			ack()
+			return False
+
+		return True
+
+	def _handle_spec(self, spec, callback, ack, nack):
 		if time.time() - spec.time_sent < self.args.message_timeout:
 			if spec.group != self.args.run:
 				self.logger.debug("Message for other group {}".format(spec.group))
-				nack()
+				ack()
 			else:
 				self.logger.debug("Received {}".format(spec))
 				callback(spec, ack, nack)
@@ -51,108 +146,165 @@ class Queue(object):
 class QueueFactory(object):
 
 	@classmethod
-	def vend(clz, args, *argv):
+	def vend(clz, args, *argv, **kwargs):
 		if args.queue_type == "google":
-			return GoogleQueue(args, *argv)
+			return GoogleQueue(args, *argv, **kwargs)
 		elif args.queue_type == "rabbitmq":
-			return RabbitQueue(args, *argv)
+			return RabbitQueue(args, *argv, **kwargs)
+		elif args.queue_type == "memory":
+			return MemoryQueue(args, *argv, **kwargs)
 		else:
 			raise ValueError(args.queue_type)
 
 
-class RabbitQuickChannel(object):
+class RabbitConnectionPool(object):
+	"""Persistent AMQP connections shared by every RabbitQueue in this process.
+
+	pika's BlockingConnection is not thread safe, so each thread (e.g. each drone
+	started by run_main_dispatch) gets its own connection and channel, created
+	lazily and reused across sends and polls. Topology is declared once per
+	connection. On any AMQP failure the thread's connection is dropped and the
+	operation retried on a fresh one.
+	"""
 
 	default_expiry = 1000 * 60 * 60 * 5
 
-	def __init__(self, args, exchange, queue, topic):
+	pools = {}
+	pools_lock = threading.Lock()
+
+	@classmethod
+	def get(clz, args):
+		# Keyed by pid so a forked child never reuses its parent's sockets
+		key = (os.getpid(), args.amqp_url)
+
+		with clz.pools_lock:
+			if key not in clz.pools:
+				clz.pools[key] = clz(args)
+			return clz.pools[key]
+
+	def __init__(self, args):
 		self.args = args
-		self.topic = topic
-		self.queue = queue
-		self.exchange = exchange
-
-		parameters = pika.URLParameters(args.amqp_url)
-		self.connection = pika.BlockingConnection(parameters)
-
-		self.channel = self._open_channel()
-
-	def _open_channel(self):
-		channel = self.connection.channel()
-		channel.basic_qos(prefetch_count=1)
-
-		channel.exchange_declare(exchange=self.exchange, exchange_type='topic', arguments={
-			'x-expires': RabbitQuickChannel.default_expiry
-		})
-		channel.queue_declare(
-			queue=self.queue, 
-			durable=True,
-			arguments={
-				'x-message-ttl' : 1000*self.args.message_timeout,
-				'x-expires': RabbitQuickChannel.default_expiry
+		self.local = threading.local()
+
+	def _connect(self):
+		parameters = pika.URLParameters(self.args.amqp_url)
+		self.local.connection = pika.BlockingConnection(parameters)
+		self.local.channel = self.local.connection.channel()
+		self.local.channel.basic_qos(prefetch_count=1)
+		self.local.declared = set()
+
+	def _channel(self, exchange, queue, bindings, max_priority):
+		connection = getattr(self.local, "connection", None)
+
+		if connection is None or connection.is_closed or self.local.channel.is_closed:
+			self._reset()
+			self._connect()
+
+		channel = self.local.channel
+
+		if (exchange, queue, bindings) not in self.local.declared:
+			channel.exchange_declare(exchange=exchange, exchange_type='topic', arguments={
+				'x-expires': RabbitConnectionPool.default_expiry
 			})
-		channel.queue_bind(queue=self.queue, exchange=self.exchange, routing_key=self.topic)
+
+			# Without bindings nothing would reach the queue, so don't leave one lying around
+			if len(bindings) > 0:
+				arguments = {
+					'x-message-ttl' : 1000*self.args.message_timeout,
+					'x-expires': RabbitConnectionPool.default_expiry
+				}
+				if max_priority is not None:
+					arguments['x-max-priority'] = max_priority
+
+				channel.queue_declare(
+					queue=queue, 
+					durable=True,
+					arguments=arguments)
+				for routing_key in bindings:
+					channel.queue_bind(queue=queue, exchange=exchange, routing_key=routing_key)
+			self.local.declared.add((exchange, queue, bindings))
 
 		return channel
 
-	def __enter__(self):
-		return self.channel
+	def _reset(self):
+		connection = getattr(self.local, "connection", None)
+		self.local.connection = None
+		self.local.channel = None
+
+		if connection is not None and not connection.is_closed:
+			try:
+				connection.close()
+			except Exception:
+				pass
+
+	def run(self, exchange, queue, bindings, fn, retries=1, max_priority=None):
+		"""Calls fn(channel) on this thread's channel, reconnecting on failure"""
+		for attempt in range(retries + 1):
+			try:
+				return fn(self._channel(exchange, queue, bindings, max_priority))
+			except pika.exceptions.AMQPError as ex:
+				logger.warning("AMQP failure on {}, reconnecting ({})".format(queue, repr(ex)))
+				self._reset()
+				if attempt >= retries:
+					raise
 
-	def __exit__(self ,type, value, traceback):
-		self.channel.close()
-		self.connection.close()
+	def close(self):
+		"""Closes the calling thread's connection"""
+		self._reset()
 
 
 class RabbitQueue(Queue):
 
-	connection = None
-
-	def __init__(self, args, exchange, queue, topic):
+	def __init__(self, args, exchange, queue, topic, types=None, max_priority=None):
 		logger = logging.getLogger(__name__ + "." + exchange + "." + queue + "." + topic)
 		super().__init__(args, logger)
 
-		self.topic    = args.run + "." + topic
-		self.queue    = args.run + "." + queue
-		self.exchange = args.run + "." + exchange
+		self._routing(exchange, queue, topic, types)
+		self.max_priority = max_priority
+		self.pool = RabbitConnectionPool.get(args)
 
 
-	def send(self, message):
-		body = pickle.dumps(message)
+	def send(self, message, priority=None):
+		body = self.encode(message)
+		routing_key = self.routing_key(message)
 
-		with RabbitQuickChannel(self.args, self.exchange, self.queue, self.topic) as channel:
+		def publish(channel):
 			channel.basic_publish(
 				exchange=self.exchange,
-				routing_key=self.topic,
+				routing_key=routing_key,
 				body=body,
 				properties=pika.BasicProperties(
 					delivery_mode = 2, # make message persistent
+					priority = priority,
+					headers = {
+						"group": message.group,
+						"type": message_type(message),
+					}
 				))
-			self.logger.debug("Sent {}".format(message))
 
-	def get_messages(self, callback, limit=None):
-		
-		def _callback(ch, method, properties, body):
-			def ack():
-				ch.basic_ack(delivery_tag = method.delivery_tag)
-				self.logger.debug("ACK {}".format(body))
+		self.pool.run(self.exchange, self.queue, self.bindings, publish, max_priority=self.max_priority)
+		self.logger.debug("Sent {}".format(message))
 
-			def nack():
-				ch.basic_nack(delivery_tag = method.delivery_tag)
-				self.logger.debug("NACK {}".format(body))
-			
-			# self.logger.debug("Received")
-
-			self._handle_message(body, callback, ack, nack)
-
-		messages = []
+	def get_messages(self, callback, limit=None):
 
-		with RabbitQuickChannel(self.args, self.exchange, self.queue, self.topic) as channel:
+		def fetch(channel):
+			messages = []
 			i = 0
 			while limit is None or i < limit:
 				method, properties, body = channel.basic_get(queue=self.queue, no_ack=True)
 				if body is not None:
-					messages.append(body)
+					# Headers let us drop foreign messages without looking at the body
+					headers = properties.headers or {}
+					if headers.get("group", self.args.run) == self.args.run:
+						messages.append(body)
+					else:
+						self.logger.debug("Message for other group {}".format(headers["group"]))
 					i += 1
 				else: 
 					break
+			return messages
+
+		messages = self.pool.run(self.exchange, self.queue, self.bindings, fetch, max_priority=self.max_priority)
 				
 		# self.logger.debug("Received {} messages".format(len(messages)))
 
@@ -160,7 +312,124 @@ class RabbitQueue(Queue):
 			self._handle_message(i, callback, lambda:True, lambda:True)
 
 	def close(self):
+		# Connections are per thread, so this closes the calling thread's one
+		self.pool.close()
+
+
+class MemoryBroker(object):
+	"""In-process stand-in for a RabbitMQ topic exchange, shared by all threads.
+
+	Queues are bound to exchanges with AMQP topic patterns ('*' matches one
+	word, '#' zero or more) and messages are stored by reference, unpickled.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.bindings = collections.defaultdict(set)
+		self.queues = {}
+
+	@staticmethod
+	def topic_matches(pattern, topic):
+		def match(p, t):
+			if len(p) == 0:
+				return len(t) == 0
+			if p[0] == "#":
+				return any(match(p[1:], t[i:]) for i in range(len(t)+1))
+			if len(t) == 0:
+				return False
+			return (p[0] == "*" or p[0] == t[0]) and match(p[1:], t[1:])
+
+		return match(pattern.split("."), topic.split("."))
+
+	def bind(self, exchange, queue, topic):
+		with self.lock:
+			self.bindings[exchange].add((queue, topic))
+			if queue not in self.queues:
+				self.queues[queue] = collections.deque()
+
+	def publish(self, exchange, topic, message, ttl, priority=0):
+		now = time.time()
+
+		with self.lock:
+			# Like AMQP, a queue gets one copy however many of its bindings match
+			matched = set(queue for queue, pattern in self.bindings[exchange] if self.topic_matches(pattern, topic))
+
+			for queue in matched:
+				q = self.queues[queue]
+
+				# Expire like x-message-ttl, so unread queues don't grow forever
+				while len(q) > 0 and now - q[0][0] > ttl:
+					q.popleft()
+
+				# Ahead of anything lower priority, behind its equals
+				idx = len(q)
+				while idx > 0 and q[idx-1][1] < priority:
+					idx -= 1
+
+				q.insert(idx, (now, priority, message))
+
+	def get(self, queue, limit=None):
+		messages = []
+
+		with self.lock:
+			q = self.queues[queue]
+			while len(q) > 0 and (limit is None or len(messages) < limit):
+				messages.append(q.popleft()[2])
+
+		return messages
+
+	def requeue(self, queue, message):
+		with self.lock:
+			self.queues[queue].append((time.time(), 0, message))
 
+
+class MemoryQueue(Queue):
+	"""Queue for supervisor and drones running as threads of one process.
+
+	Mirrors RabbitQueue's exchange/queue/topic naming and routing, but passes
+	specs through a process-wide MemoryBroker, with no broker, network hop or
+	encoding. Each receiver gets its own deep copy, as it would from a real
+	broker, so a worker changing its params in place doesn't change the
+	supervisor's or another worker's.
+	"""
+
+	broker = MemoryBroker()
+
+	@property
+	def passes_objects(self):
+		return True
+
+	def __init__(self, args, exchange, queue, topic, types=None, max_priority=None):
+		logger = logging.getLogger(__name__ + "." + exchange + "." + queue + "." + topic)
+		super().__init__(args, logger)
+
+		self._routing(exchange, queue, topic, types)
+		self.max_priority = max_priority
+
+		for routing_key in self.bindings:
+			MemoryQueue.broker.bind(self.exchange, self.queue, routing_key)
+
+	def send(self, message, priority=None):
+		# Like RabbitMQ, priority only counts on queues declared with max_priority
+		if priority is None or self.max_priority is None:
+			priority = 0
+		else:
+			priority = min(priority, self.max_priority)
+
+		MemoryQueue.broker.publish(self.exchange, self.routing_key(message), message, self.args.message_timeout, priority)
+		self.logger.debug("Sent {}".format(message))
+
+	def get_messages(self, callback, limit=None):
+		for spec in MemoryQueue.broker.get(self.queue, limit):
+			def ack():
+				pass
+
+			def nack(spec=spec):
+				MemoryQueue.broker.requeue(self.queue, spec)
+
+			self._handle_spec(copy.deepcopy(spec), callback, ack, nack)
+
+	def close(self):
 		pass
 
 
@@ -176,13 +445,13 @@ class GoogleQueue(Queue):
 		self.pub_client = None
 		self.sub_sub = None
 
-	def send(self, message):
+	def send(self, message, priority=None):
 		if self.pub_client is None:
 			self.pub_client = pubsub_v1.PublisherClient()
 			self.topic_path = self.pub_client.topic_path(self.args.project, self.pub_topic)
 
-		data = pickle.dumps(message)
-		self.pub_client.publish(self.topic_path, data=data)
+		data = self.encode(message)
+		self.pub_client.publish(self.topic_path, data=data, group=message.group, type=message_type(message))
 
 	def get_messages(self, callback):
 		if self.sub_client is None:
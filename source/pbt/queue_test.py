@@ -0,0 +1,149 @@
+import unittest
+import collections
+import logging
+import pickle
+import time
+
+from .queue import Queue, QueueFactory, MemoryBroker, MemoryQueue
+
+Message = collections.namedtuple('Message', ['group', 'time_sent', 'body'])
+
+class QueueArgs(object):
+	def __init__(self, run="queue_test"):
+		self.run = run
+		self.queue_type = "memory"
+		self.message_timeout = 60
+		self.wire_format = "compact"
+		self.accept_pickle = False
+
+class MemoryQueueTestCase(unittest.TestCase):
+
+	def receive(self, queue, limit=None):
+		received = []
+		queue.get_messages(lambda spec, ack, nack: received.append(spec.body), limit)
+		return received
+
+	def test_topic_matches(self):
+		self.assertTrue(MemoryBroker.topic_matches("run.*", "run.result"))
+		self.assertTrue(MemoryBroker.topic_matches("run.#", "run.a.b"))
+		self.assertFalse(MemoryBroker.topic_matches("run.*", "run.a.b"))
+		self.assertFalse(MemoryBroker.topic_matches("run.result", "run.heartbeat"))
+
+	def test_routing(self):
+		args = QueueArgs("test_routing")
+		supervisor = QueueFactory.vend(args, "result", "result_supervisor", "*")
+		heartbeat_a = QueueFactory.vend(args, "result", "drone_a", "heartbeat")
+		heartbeat_b = QueueFactory.vend(args, "result", "drone_b", "heartbeat")
+		result = QueueFactory.vend(args, "result", "result_shared", "result")
+
+		body = {"by": "value"}
+		result.send(Message(args.run, time.time(), body))
+		heartbeat_a.send(Message(args.run, time.time(), "beat"))
+
+		received = self.receive(supervisor)
+		self.assertEqual(len(received), 2)
+		self.assertEqual(received[0], body)
+		self.assertIsNot(received[0], body)
+
+		self.assertEqual(self.receive(heartbeat_a), ["beat"])
+		self.assertEqual(self.receive(heartbeat_b), ["beat"])
+		self.assertEqual(self.receive(heartbeat_b), [])
+
+	def test_receivers_get_copies(self):
+		args = QueueArgs("test_receivers_get_copies")
+		a = QueueFactory.vend(args, "result", "result_a", "result")
+		b = QueueFactory.vend(args, "result", "result_b", "result")
+
+		body = {"state": [0]}
+		a.send(Message(args.run, time.time(), body))
+
+		received_a = self.receive(a)[0]
+		received_a["state"][0] += 1
+
+		self.assertEqual(body, {"state": [0]})
+		self.assertEqual(self.receive(b), [{"state": [0]}])
+
+	def test_type_routing(self):
+		args = QueueArgs("test_type_routing")
+		messages = QueueFactory.vend(args, "result", "result_messages", "*", types=["message"])
+		others = QueueFactory.vend(args, "result", "result_others", "*", types=["other"])
+		both = QueueFactory.vend(args, "result", "result_both", "*", types=["message", "other"])
+		sender = QueueFactory.vend(args, "result", "result_shared", "result")
+
+		sender.send(Message(args.run, time.time(), "typed"))
+
+		self.assertEqual(self.receive(messages), ["typed"])
+		self.assertEqual(self.receive(others), [])
+		self.assertEqual(self.receive(both), ["typed"])
+
+	def test_publish_only(self):
+		args = QueueArgs("test_publish_only")
+		supervisor = QueueFactory.vend(args, "result", "result_supervisor", "*")
+		sender = QueueFactory.vend(args, "result", "result_shared", "result", types=[])
+
+		sender.send(Message(args.run, time.time(), "sent"))
+
+		self.assertEqual(sender.bindings, ())
+		self.assertNotIn(sender.queue, MemoryQueue.broker.queues)
+		self.assertEqual(self.receive(supervisor), ["sent"])
+
+	def test_pickle_opt_in(self):
+		args = QueueArgs("test_pickle_opt_in")
+		queue = Queue(args, logging.getLogger(__name__))
+		data = pickle.dumps(Message(args.run, time.time(), "pickled"))
+
+		received = []
+		acks = []
+		callback = lambda spec, ack, nack: received.append(spec.body)
+
+		queue._handle_message(data, callback, lambda: acks.append(1), lambda: None)
+		self.assertEqual(received, [])
+		self.assertEqual(acks, [1])
+
+		args.accept_pickle = True
+		queue._handle_message(data, callback, lambda: acks.append(1), lambda: None)
+		self.assertEqual(received, ["pickled"])
+
+	def test_other_group_dropped(self):
+		args = QueueArgs("test_other_group")
+		run = QueueFactory.vend(args, "run", "run_shared", "run")
+		run.send(Message("someone_else", time.time(), "foreign"))
+
+		self.assertEqual(self.receive(run), [])
+		self.assertEqual(self.receive(run), [])
+
+	def test_limit_and_timeout(self):
+		args = QueueArgs("test_limit")
+		run = QueueFactory.vend(args, "run", "run_shared", "run")
+
+		run.send(Message(args.run, time.time() - 2 * args.message_timeout, "stale"))
+		for i in range(3):
+			run.send(Message(args.run, time.time(), i))
+
+		self.assertEqual(self.receive(run, 1), [])
+		self.assertEqual(self.receive(run, 1), [0])
+		self.assertEqual(self.receive(run), [1, 2])
+
+	def test_priority(self):
+		args = QueueArgs("test_priority")
+		run = QueueFactory.vend(args, "run", "run_shared", "run", max_priority=10)
+
+		run.send(Message(args.run, time.time(), "low"), 1)
+		run.send(Message(args.run, time.time(), "default"))
+		run.send(Message(args.run, time.time(), "high"), 9)
+		run.send(Message(args.run, time.time(), "also_high"), 9)
+
+		self.assertEqual(self.receive(run), ["high", "also_high", "low", "default"])
+
+	def test_nack_requeues(self):
+		args = QueueArgs("test_nack")
+		run = QueueFactory.vend(args, "run", "run_shared", "run")
+		run.send(Message(args.run, time.time(), "retry"))
+
+		run.get_messages(lambda spec, ack, nack: nack())
+		self.assertEqual(self.receive(run), ["retry"])
+
+
+
+if __name__ == '__main__':
+	unittest.main()
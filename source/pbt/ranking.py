@@ -0,0 +1,110 @@
+
+import random
+
+from sortedcontainers import SortedList
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RankedPopulation(object):
+	"""Incrementally maintained stack rank of scored workers.
+
+	Ordering matches the old get_sorted_workers: index 0 is the worst worker and
+	index -1 the best. Ties are broken by a random draw taken each time a worker's
+	score changes, so equal scorers are shuffled without re-sorting everyone.
+
+	Workers whose score is None are not ranked.
+	"""
+
+	def __init__(self, score, reverse=False):
+		self.score = score
+		self.reverse = reverse
+
+		self.entries = SortedList()
+		self.keys = {}
+		self.members = {}
+
+	def _key(self, worker):
+		s = self.score(worker)
+		if s is None:
+			return None
+
+		return (-s if self.reverse else s, random.random(), worker.id)
+
+	# --------------------------------------------------------------------------
+	# Mutation
+	# --------------------------------------------------------------------------
+
+	def add(self, worker):
+		"""Insert or re-rank worker. Call whenever its score may have changed"""
+		self.discard(worker)
+
+		key = self._key(worker)
+		if key is not None:
+			self.entries.add(key)
+			self.keys[worker.id] = key
+			self.members[worker.id] = worker
+
+	def discard(self, worker_or_id):
+		worker_id = getattr(worker_or_id, "id", worker_or_id)
+		key = self.keys.pop(worker_id, None)
+
+		if key is not None:
+			self.entries.remove(key)
+			del self.members[worker_id]
+
+	def rebuild(self, workers):
+		self.entries.clear()
+		self.keys.clear()
+		self.members.clear()
+
+		for i in workers:
+			self.add(i)
+
+	# --------------------------------------------------------------------------
+	# Queries
+	# --------------------------------------------------------------------------
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, worker):
+		return worker.id in self.keys
+
+	def rank(self, worker):
+		"""Returns position of worker in the stack (0 is worst) or None if unranked"""
+		key = self.keys.get(worker.id, None)
+		if key is None:
+			return None
+		return self.entries.index(key)
+
+	def _at(self, keys):
+		return [self.members[k[2]] for k in keys]
+
+	def bottom(self, n):
+		"""The n worst workers, worst first"""
+		n = max(int(n), 0)
+		return self._at(self.entries.islice(0, n))
+
+	def top(self, n):
+		"""The n best workers, in ascending order (best is last)"""
+		n = min(max(int(n), 0), len(self.entries))
+		return self._at(self.entries.islice(len(self.entries) - n))
+
+	def top_pct(self, pct):
+		return self.top(max(round(len(self.entries) * pct), 1))
+
+	def best(self):
+		if len(self.entries) == 0:
+			return None
+		return self.members[self.entries[-1][2]]
+
+	def worst(self):
+		if len(self.entries) == 0:
+			return None
+		return self.members[self.entries[0][2]]
+
+	def sorted(self):
+		return self._at(self.entries)
+
@@ -0,0 +1,58 @@
+import unittest
+import random
+
+from .ranking import RankedPopulation
+
+class MockHeader(object):
+	def __init__(self, id, score):
+		self.id = id
+		self.score = score
+
+class RankingTestCase(unittest.TestCase):
+
+	def vend_population(self, n=40, reverse=False):
+		workers = [MockHeader(i, random.choice([None, 1, 2, 3, 4])) for i in range(n)]
+		ranking = RankedPopulation(lambda w: w.score, reverse)
+		ranking.rebuild(workers)
+		return workers, ranking
+
+	def test_matches_full_sort(self):
+		workers, ranking = self.vend_population()
+		expected = sorted([i.score for i in workers if i.score is not None])
+
+		self.assertEqual([i.score for i in ranking.sorted()], expected)
+		self.assertEqual(len(ranking), len(expected))
+
+		for idx, w in enumerate(ranking.sorted()):
+			self.assertEqual(ranking.rank(w), idx)
+
+	def test_reverse(self):
+		workers, ranking = self.vend_population(reverse=True)
+		expected = sorted([i.score for i in workers if i.score is not None], reverse=True)
+		self.assertEqual([i.score for i in ranking.sorted()], expected)
+
+	def test_update_and_discard(self):
+		workers, ranking = self.vend_population()
+
+		w = workers[0]
+		w.score = 100
+		ranking.add(w)
+		self.assertIs(ranking.best(), w)
+		self.assertEqual(ranking.top(1), [w])
+
+		w.score = None
+		ranking.add(w)
+		self.assertIsNone(ranking.rank(w))
+
+		w.score = -1
+		ranking.add(w)
+		self.assertIs(ranking.worst(), w)
+		self.assertEqual(ranking.bottom(1), [w])
+
+		ranking.discard(w)
+		self.assertFalse(w in ranking)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,47 @@
+
+import heapq
+import itertools
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RunQueue(object):
+	"""Min-heap of workers waiting for a run slot, lowest priority first.
+
+	Like DeadlineQueue, each key has at most one live entry and stale entries
+	are dropped lazily when they reach the top. Equal priorities pop in the
+	order they were pushed.
+	"""
+
+	def __init__(self):
+		self.heap = []
+		self.priorities = {}
+		self.counter = itertools.count()
+
+	def __len__(self):
+		return len(self.priorities)
+
+	def __contains__(self, key):
+		return key in self.priorities
+
+	def push(self, key, priority):
+		entry = (priority, next(self.counter), key)
+		self.priorities[key] = entry
+		heapq.heappush(self.heap, entry)
+
+	def discard(self, key):
+		self.priorities.pop(key, None)
+
+	def pop(self):
+		"""Removes and returns the key with the lowest priority, or None if empty"""
+		while len(self.heap) > 0:
+			entry = heapq.heappop(self.heap)
+			key = entry[2]
+
+			if self.priorities.get(key, None) is entry:
+				del self.priorities[key]
+				return key
+
+		return None
+
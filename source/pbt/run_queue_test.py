@@ -0,0 +1,33 @@
+import unittest
+
+from .run_queue import RunQueue
+
+class RunQueueTestCase(unittest.TestCase):
+
+	def test_priority_order(self):
+		q = RunQueue()
+		q.push("b", 2)
+		q.push("a", 1)
+		q.push("c", 2)
+
+		self.assertEqual([q.pop(), q.pop(), q.pop()], ["a", "b", "c"])
+		self.assertIsNone(q.pop())
+
+	def test_reprioritise_and_discard(self):
+		q = RunQueue()
+		q.push("a", 1)
+		q.push("b", 2)
+		q.push("c", 3)
+
+		q.push("a", 4)
+		q.discard("b")
+
+		self.assertEqual(len(q), 2)
+		self.assertNotIn("b", q)
+		self.assertEqual([q.pop(), q.pop()], ["c", "a"])
+		self.assertEqual(len(q), 0)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
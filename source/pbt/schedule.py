@@ -1,4 +1,114 @@
 
+import math
+
+from sortedcontainers import SortedList
+
+import logging
+logger = logging.getLogger(__name__)
+
 
 def decay_schedule(start_val=40, end_val=10, decay_period=30):
 	return lambda epoch: round(end_val + start_val * max(decay_period-epoch,0)/decay_period)
+
+
+
+class Scheduler(object):
+	"""Decides, as each result comes in, whether a worker is worth more training.
+
+	The Supervisor calls on_result after recording every successful ResultSpec
+	and replaces the worker with a new one if it returns STOP. This base
+	class never stops anyone, leaving culling to consider_exploit.
+	"""
+
+	CONTINUE = "continue"
+	STOP = "stop"
+
+	def __init__(self, score, reverse=False):
+		self.score = score
+		self.reverse = reverse
+
+	def on_result(self, worker):
+		return Scheduler.CONTINUE
+
+	def on_delete(self, worker_id):
+		pass
+
+
+class AsyncSuccessiveHalving(Scheduler):
+	"""Asynchronous successive halving (ASHA).
+
+	Rungs sit at min_steps * eta^k total steps. The first result at or past a
+	rung records the worker's score there. If that score is below the top
+	1/eta of scores recorded at the rung so far, the worker is stopped. Nobody
+	waits for a rung to fill. Stopping only starts once a rung has
+	min_rung_size scores, so the first few arrivals aren't judged against
+	each other.
+	"""
+
+	def __init__(self, score, reverse=False, min_steps=1000, eta=3, min_rung_size=None):
+		super().__init__(score, reverse)
+		self.min_steps = min_steps
+		self.eta = eta
+		self.min_rung_size = min_rung_size if min_rung_size is not None else math.ceil(eta)
+
+		self.rungs = {}
+		self.next_rung = {}
+
+	def rung_for(self, total_steps):
+		"""Highest rung reached at total_steps, or None if not yet at the first"""
+		if total_steps < self.min_steps:
+			return None
+
+		k = int(math.floor(math.log(total_steps / self.min_steps, self.eta)))
+
+		# Guard against floating point landing either side of an exact rung
+		while self.min_steps * self.eta ** (k+1) <= total_steps:
+			k += 1
+		while k > 0 and self.min_steps * self.eta ** k > total_steps:
+			k -= 1
+
+		return k
+
+	def on_result(self, worker):
+		k = self.rung_for(worker.total_steps)
+		if k is None or k < self.next_rung.get(worker.id, 0):
+			return Scheduler.CONTINUE
+
+		s = self.score(worker)
+		if s is None:
+			return Scheduler.CONTINUE
+
+		# Higher is better inside the rung
+		s = -s if self.reverse else s
+
+		self.next_rung[worker.id] = k + 1
+		rung = self.rungs.setdefault(k, SortedList())
+		rung.add(s)
+
+		if len(rung) < self.min_rung_size:
+			return Scheduler.CONTINUE
+
+		n_keep = max(int(len(rung) / self.eta), 1)
+		cutoff = rung[-n_keep]
+
+		if s < cutoff:
+			logger.info("{} stopped at rung {} ({} steps), score {} below cutoff {}".format(
+				worker.id, k, worker.total_steps, s, cutoff))
+			return Scheduler.STOP
+
+		return Scheduler.CONTINUE
+
+	def on_delete(self, worker_id):
+		# Its scores stay in the rungs, they're still evidence for the cutoff
+		self.next_rung.pop(worker_id, None)
+
+
+def gen_scheduler(args, score, reverse=False):
+	if args.scheduler == "asha":
+		return AsyncSuccessiveHalving(score, reverse,
+			min_steps=args.asha_min_steps if args.asha_min_steps > 0 else args.micro_step,
+			eta=args.asha_eta,
+			min_rung_size=args.asha_min_rung_size if args.asha_min_rung_size > 0 else None)
+
+	return Scheduler(score, reverse)
+
@@ -0,0 +1,47 @@
+import unittest
+
+from .schedule import Scheduler, AsyncSuccessiveHalving
+
+class MockHeader(object):
+	def __init__(self, id, score, total_steps):
+		self.id = id
+		self.score = score
+		self.total_steps = total_steps
+
+class ScheduleTestCase(unittest.TestCase):
+
+	def vend_scheduler(self, reverse=False):
+		return AsyncSuccessiveHalving(lambda w: w.score, reverse, min_steps=100, eta=2, min_rung_size=2)
+
+	def test_rung_for(self):
+		s = self.vend_scheduler()
+		self.assertIsNone(s.rung_for(99))
+		self.assertEqual(s.rung_for(100), 0)
+		self.assertEqual(s.rung_for(199), 0)
+		self.assertEqual(s.rung_for(200), 1)
+		self.assertEqual(s.rung_for(800), 3)
+
+	def test_stops_bottom_of_rung(self):
+		s = self.vend_scheduler()
+
+		self.assertEqual(s.on_result(MockHeader("a", 0.9, 100)), Scheduler.CONTINUE)
+		self.assertEqual(s.on_result(MockHeader("b", 0.1, 100)), Scheduler.STOP)
+		self.assertEqual(s.on_result(MockHeader("c", 0.95, 120)), Scheduler.CONTINUE)
+
+		# Only judged once per rung
+		self.assertEqual(s.on_result(MockHeader("c", 0.0, 150)), Scheduler.CONTINUE)
+
+	def test_reverse(self):
+		s = self.vend_scheduler(reverse=True)
+
+		self.assertEqual(s.on_result(MockHeader("a", 0.1, 100)), Scheduler.CONTINUE)
+		self.assertEqual(s.on_result(MockHeader("b", 0.9, 100)), Scheduler.STOP)
+
+	def test_base_never_stops(self):
+		s = Scheduler(lambda w: w.score)
+		self.assertEqual(s.on_result(MockHeader("a", 0.0, 10000)), Scheduler.CONTINUE)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
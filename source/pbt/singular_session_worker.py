@@ -7,9 +7,11 @@ import os.path
 import time
 
 from .worker import Worker
+from .weight_cache import WeightCache
+from .weight_bundle import bundle_exists, save_bundle, load_bundle
+from .chunk_store import ChunkStore
 from .param import *
 from .params import *
-from util import path_exists
 
 import logging
 logger = logging.getLogger(__name__)
@@ -17,7 +19,7 @@ logger = logging.getLogger(__name__)
 tf.logging.set_verbosity("INFO")
 
 class ModelSession(object):
-	def __init__(self, init_params, friendly_params, model_dir, warm_start_dir, mode):
+	def __init__(self, init_params, friendly_params, model_dir, warm_start_dir, mode, warm_weights=None):
 
 		self.init_params = init_params
 		self.friendly_params = friendly_params
@@ -39,17 +41,33 @@ class ModelSession(object):
 
 			self.model_mode = mode
 
+			# Used to move weights between long-lived sessions without a checkpoint round-trip
+			self.variables = {v.op.name: v for v in tf.global_variables()}
+
+			self.weight_feeds = {}
+			self.weight_assigns = []
+
+			for name, var in self.variables.items():
+				feed = tf.placeholder(var.dtype.base_dtype, shape=var.get_shape())
+				self.weight_feeds[name] = feed
+				self.weight_assigns.append(var.assign(feed))
+
+			if mode == "eval":
+				self.reset_metrics = tf.variables_initializer(tf.get_collection(tf.GraphKeys.METRIC_VARIABLES))
+
+				# The eval input is a seeded random stream, which would move on
+				# each time a long-lived session evaluates. Its first batches are
+				# drawn once and fed back every eval, so all evals score the same data
+				self.input_tensors = [inpt[0]] + [inpt[1][k] for k in sorted(inpt[1].keys())]
+				self.eval_batches = []
+
 			hooks = [
 			]
 
 			if mode == "train":
+				# Saved explicitly at the end of each do_step (see save), as step
+				# counts vary per run and the session outlives runs
 				self.saver = tf.train.Saver()
-				self.checkpoint_saver = tf.train.CheckpointSaverHook(
-						checkpoint_dir=self.model_dir,
-						save_steps=self.friendly_params["micro_step"],
-						saver=self.saver)
-
-				hooks.append(self.checkpoint_saver)
 
 			if self.init_params.get('profile', False):
 				profiler = tf.train.ProfilerHook(save_steps=100, output_dir=self.model_dir)
@@ -65,23 +83,121 @@ class ModelSession(object):
 					)
 				)
 
-			# Transparent across GCS and local paths
-			if path_exists(self.model_dir):
+			self.chunk_store = None
+			if self.init_params.get("chunk_store", False):
+				self.chunk_store = ChunkStore.for_run(self.init_params["model_dir"], self.init_params["run"], self.init_params.get("chunk_size_kb", 1024))
+
+			self.use_bundle = self.init_params.get("weight_bundle", False) or self.chunk_store is not None
+
+			# Transparent across GCS and local paths. A bundle replaces the TF
+			# checkpoint, so there's nothing to fall back to if it can't be read
+			if self.use_bundle and self.try_load_bundle(self.model_dir) is not None:
+				load_dir = None
+				warm_weights = self.bundle_weights
+			elif tf.train.latest_checkpoint(self.model_dir) is not None:
 				# We should resume from that location
 				load_dir = self.model_dir
+				warm_weights = None
+			elif warm_weights is not None:
+				# The mentor's weights are already in memory, skip its checkpoint
+				load_dir = None
+			elif self.use_bundle and self.try_load_bundle(self.warm_start_dir) is not None:
+				load_dir = None
+				warm_weights = self.bundle_weights
 			else:
 				# We should try to warm start
 				load_dir = self.warm_start_dir
 
+				if load_dir is not None and tf.train.latest_checkpoint(load_dir) is None:
+					logger.warning("No checkpoint or weight bundle in {}, starting from scratch".format(load_dir))
+
 			logger.debug("model_dir: {}  warm_start_dir: {} load from:{}".format(self.model_dir, self.warm_start_dir, load_dir))
 
+			config = None
+			if self.init_params.get("intra_op_threads", 0) or self.init_params.get("inter_op_threads", 0):
+				config = tf.ConfigProto(
+					intra_op_parallelism_threads=self.init_params.get("intra_op_threads", 0),
+					inter_op_parallelism_threads=self.init_params.get("inter_op_threads", 0))
+
 			self.sess = tf.train.SingularMonitoredSession(
-				hooks=hooks, checkpoint_dir=load_dir
+				hooks=hooks, checkpoint_dir=load_dir, config=config
 			)
 
-	def run(self, ops):
+			# Nothing is written to model_dir until the first save, so a crash
+			# before then warm starts again rather than resuming a fresh init
+			if warm_weights is not None:
+				self.set_weights(warm_weights)
+
+	def try_load_bundle(self, model_dir):
+		"""Sets and returns self.bundle_weights from model_dir's weight bundle, or None if it has none.
+		Raises if it has one that can't be read, rather than quietly starting from random weights"""
+		self.bundle_weights = None
+
+		if bundle_exists(model_dir):
+			self.bundle_weights = load_bundle(model_dir, self.chunk_store)
+			logger.debug("Loaded weight bundle from {}".format(model_dir))
+
+		return self.bundle_weights
+
+	def run(self, ops, feed_dict=None):
 		with self.graph.as_default():
-			return self.sess.run(ops)
+			return self.sess.run(ops, feed_dict=feed_dict)
+
+	def eval_feed(self, i):
+		"""Feed for the i-th eval batch, the same batch on every eval"""
+		while len(self.eval_batches) <= i:
+			with self.graph.as_default():
+				self.eval_batches.append(self.sess.raw_session().run(self.input_tensors))
+
+		return dict(zip(self.input_tensors, self.eval_batches[i]))
+
+	def run_eval(self, steps):
+		metrics = self.model.eval_metric_ops
+		updates = {k: v[1] for k, v in metrics.items()}
+		values = {k: v[0] for k, v in metrics.items()}
+
+		for i in range(steps):
+			self.run(updates, self.eval_feed(i))
+
+		# Read after the updates, a value fetched alongside its update may or may not include it
+		return {
+			k: float(v)
+			for k, v in self.run(values).items()
+		}
+
+	def get_weights(self):
+		"""Returns dict of variable name to value, bypassing the session hooks"""
+		with self.graph.as_default():
+			return self.sess.raw_session().run(self.variables)
+
+	def set_weights(self, weights):
+		"""Loads weights from another session's get_weights"""
+		feed_dict = {
+			feed: weights[name]
+			for name, feed in self.weight_feeds.items()
+			if name in weights
+		}
+
+		missing = [name for name in self.weight_feeds if name not in weights]
+		if len(missing) > 0:
+			logger.warning("set_weights missing variables {}".format(missing))
+
+		with self.graph.as_default():
+			self.sess.raw_session().run(self.weight_assigns, feed_dict=feed_dict)
+			if self.model_mode == "eval":
+				self.sess.raw_session().run(self.reset_metrics)
+
+	def save_bundle(self, weights=None):
+		"""Writes this session's variables as a weight bundle in model_dir"""
+		save_bundle(self.model_dir, weights if weights is not None else self.get_weights(), self.chunk_store)
+
+	def save(self, weights=None):
+		"""Checkpoint the train session to model_dir, as a weight bundle if enabled"""
+		if self.use_bundle:
+			self.save_bundle(weights)
+		else:
+			with self.graph.as_default():
+				self.saver.save(self.sess.raw_session(), os.path.join(self.model_dir, "model.ckpt"), global_step=tf.train.get_global_step())
 
 	def close(self):
 		if self.sess is not None:
@@ -101,39 +217,140 @@ class SingularSessionWorker(Worker):
 	
 	def __init__(self, init_params, hyperparam_spec):
 		self._params = {}
+		self.reset_session_cache()
 
 		super().__init__(init_params, hyperparam_spec)
 
 
-	def get_model_session(self, mode="train"):
+	def get_model_session(self, mode="train", warm_weights=None):
 		return ModelSession(
 			self.init_params,
 			self.friendly_params,
 			self.model_dir,
 			self.warm_start_dir,
-			mode
+			mode,
+			warm_weights
 		)
 
+	def get_weight_cache(self):
+		"""This process's WeightCache, or None if --weight-cache-size is 0"""
+		size = self.init_params.get("weight_cache_size", 0)
+		if size > 0:
+			return WeightCache.get_shared(size)
+		return None
+
+	def get_warm_weights(self):
+		"""The mentor's weights if cached at the step this worker was bred from, else None"""
+		weight_cache = self.get_weight_cache()
+		warm_start_from = self.friendly_params["model_id"]["warm_start_from"]
+		warm_start_steps = getattr(self, "warm_start_steps", None)
+
+		# Resuming our own model, or the mentor has moved on: use the checkpoint
+		if weight_cache is None or warm_start_from is None or warm_start_steps is None or self.total_steps > 0:
+			return None
+
+		weights = weight_cache.get(warm_start_from, warm_start_steps)
+		if weights is not None:
+			logger.debug("{} warm starting from {} in memory".format(self.id, warm_start_from))
+		return weights
+
+	# --------------------------------------------------------------------------
+	# Session cache
+	# 
+	# The train and eval graphs live across micro and macro steps. The train
+	# session is only rebuilt (and weights reloaded from checkpoint) when the
+	# model_id changes or when some other drone may have trained this model
+	# since we last did (detected by total_steps not matching our own count).
+	# --------------------------------------------------------------------------
+
+	def reset_session_cache(self):
+		self.train_session = None
+		self.eval_session = None
+		self.session_model_dir = None
+		self.session_total_steps = None
+
+	def release_weights(self):
+		"""Stop the weight cache fetching from our train session"""
+		weight_cache = self.get_weight_cache()
+		if weight_cache is not None:
+			weight_cache.release(self.friendly_params["model_id"]["cur"])
+
+	def close(self):
+		if self.train_session is not None:
+			self.release_weights()
+
+		for sm in [self.train_session, self.eval_session]:
+			if sm is not None:
+				sm.close()
+
+		self.reset_session_cache()
+
+	def get_train_session(self):
+		if self.session_model_dir != self.model_dir or self.session_total_steps != self.total_steps:
+			if self.train_session is not None:
+				logger.debug("{}.get_train_session() reloading, model_dir:{} steps:{} != {}".format(
+					self.id, self.model_dir, self.total_steps, self.session_total_steps))
+			self.close()
+
+		if self.train_session is None:
+			self.train_session = self.get_model_session("train", self.get_warm_weights())
+			self.session_model_dir = self.model_dir
+			self.session_total_steps = self.total_steps
+
+		return self.train_session
+
+	def get_eval_session(self):
+		if self.eval_session is None:
+			self.eval_session = self.get_model_session("eval")
+
+		self.eval_session.set_weights(self.train_session.get_weights())
+		return self.eval_session
+
 
 		
 	def do_step(self, steps, heartbeat, should_continue):
-		with self.get_model_session("train") as sm:
+		sm = self.get_train_session()
+
+		# Training moves the session past the snapshot we last cached
+		self.release_weights()
+
+		try:
+			# Session build and restore above aren't part of the step cost
+			started = time.time()
+
 			for i in range(steps):
 				_, loss = sm.run([sm.model.train_op, sm.model.loss])
 				heartbeat()
 				should_continue()
 
+			self.train_secs = time.time() - started
+
+		except:
+			# We don't know how far training got, so next time restore from checkpoint
+			self.close()
+			raise
+
+		self.session_total_steps = self.total_steps + steps
+
+		weights = sm.get_weights() if sm.use_bundle else None
+
+		weight_cache = self.get_weight_cache()
+		if weight_cache is not None:
+			# Only fetched if a child asks for it before we train again
+			weight_cache.put(self.friendly_params["model_id"]["cur"], self.session_total_steps,
+				weights if weights is not None else sm.get_weights)
+
+		# Every run ends on a checkpoint, whatever its step count
+		sm.save(weights)
+
 			
 
 	def do_eval(self):
-		with self.get_model_session("eval") as sm:
-			for i in range(self.init_params["eval_steps"]):
-				r = sm.run(sm.model.eval_metric_ops)
+		if self.train_session is not None:
+			return self.get_eval_session().run_eval(self.init_params["eval_steps"])
 
-		return {
-			k: float(v[0])
-			for k, v in r.items()
-		}
+		with self.get_model_session("eval") as sm:
+			return sm.run_eval(self.init_params["eval_steps"])
 		
 
 	# Hooks for Pickle
@@ -157,5 +374,7 @@ class SingularSessionWorker(Worker):
 		self.results        = state.get("results", {})
 		self._params        = state.get("_params", {})
 
+		self.reset_session_cache()
+
 		
 
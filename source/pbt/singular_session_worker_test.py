@@ -0,0 +1,73 @@
+import unittest
+import os
+import os.path
+import tempfile
+import collections
+
+import tensorflow as tf
+
+from .singular_session_worker import ModelSession
+from .weight_bundle import MANIFEST
+
+# The parts of an EstimatorSpec that ModelSession uses
+Model = collections.namedtuple('Model', ['train_op', 'loss', 'eval_metric_ops'])
+
+def input_fn(params):
+	def gen():
+		# Seeded like the experiment's eval set: a fresh session restarts the stream
+		tf.set_random_seed(123)
+		x = tf.random_uniform([4, 2])
+		return x, {"target": tf.reduce_sum(x, axis=1)}
+	return gen
+
+def model_fn(features, labels, mode, params):
+	w = tf.get_variable("w", [2], initializer=tf.ones_initializer())
+	prediction = tf.reduce_sum(features * w, axis=1)
+
+	return Model(
+		train_op=None,
+		loss=tf.reduce_mean(prediction),
+		eval_metric_ops={
+			"prediction": tf.metrics.mean(prediction),
+			"target": tf.metrics.mean(labels["target"]),
+		})
+
+class ModelSessionTestCase(unittest.TestCase):
+
+	def test_eval_repeatable(self):
+		init_params = {"eval_input_fn": input_fn, "model_fn": model_fn}
+
+		with tempfile.TemporaryDirectory() as root:
+			model_dir = os.path.join(root, "model")
+
+			with ModelSession(init_params, {}, model_dir, None, "eval") as sm:
+				weights = sm.get_weights()
+
+				first = sm.run_eval(3)
+				sm.set_weights(weights)
+				second = sm.run_eval(3)
+
+			# A new session sees the same batches as the long-lived one
+			with ModelSession(init_params, {}, model_dir, None, "eval") as sm:
+				fresh = sm.run_eval(3)
+
+		self.assertEqual(first, second)
+		self.assertEqual(first, fresh)
+
+	def test_unreadable_bundle_raises(self):
+		init_params = {"eval_input_fn": input_fn, "model_fn": model_fn, "weight_bundle": True}
+
+		with tempfile.TemporaryDirectory() as root:
+			model_dir = os.path.join(root, "model")
+			os.makedirs(model_dir)
+			with open(os.path.join(model_dir, MANIFEST), "w") as file:
+				file.write("{")
+
+			# There's no TF checkpoint behind it, so carrying on would start from random weights
+			with self.assertRaises(Exception):
+				ModelSession(init_params, {}, model_dir, None, "eval")
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -24,7 +24,9 @@ RunSpec = collections.namedtuple('RunSpec', [
 	'total_steps',
 	'micro_step',
 	'macro_step',
-	'time_sent'])
+	'time_sent',
+	'params_hash',
+	'warm_start_steps'])
 
 
 ResultSpec = collections.namedtuple('ResultSpec', [
@@ -37,17 +39,32 @@ ResultSpec = collections.namedtuple('ResultSpec', [
 	'recent_steps',
 	'total_steps',
 	'params',
-	'time_sent'])
+	'time_sent',
+	'run_id',
+	'secs_per_step'])
 
+# Claims or renews the lease on run_id
 HeartbeatSpec = collections.namedtuple('HeartbeatSpec', [
 	'group', 
 	'from_hostname',
 	'run_id',
 	'worker_id', 
-	'tiebreaker',
+	'drone_id',
 	'total_steps',
 	'time_sent'])
 
+# Supervisor's reply to a HeartbeatSpec: the drone holds the lease until
+# expires, or must stop if not granted
+LeaseSpec = collections.namedtuple('LeaseSpec', [
+	'group',
+	'from_hostname',
+	'run_id',
+	'worker_id',
+	'drone_id',
+	'granted',
+	'expires',
+	'time_sent'])
+
 GiveUpSpec = collections.namedtuple('GiveUpSpec', [
 	'group',
 	'from_hostname',
@@ -56,6 +73,24 @@ GiveUpSpec = collections.namedtuple('GiveUpSpec', [
 	'worker_id'
 ])
 
+AffinitySpec = collections.namedtuple('AffinitySpec', [
+	'group',
+	'from_hostname',
+	'drone_id',
+	'worker_ids',
+	'model_ids',
+	'time_sent'
+])
+
+# How many runs a drone can take on, for --flow-control
+CreditSpec = collections.namedtuple('CreditSpec', [
+	'group',
+	'from_hostname',
+	'drone_id',
+	'slots',
+	'time_sent'
+])
+
 
 
 class WorkerHeader(object):
@@ -64,16 +99,35 @@ class WorkerHeader(object):
 		self.id = petname.Generate(3,'-') + "-" + str(uuid.uuid4())
 		self.params = params
 
+		self.params_hash = None
+
+		# The mentor's total_steps when this worker was bred from it
+		self.warm_start_steps = None
+
+		# The run currently entitled to train this worker and the drone holding it
+		self.lease_run_id = None
+		self.lease_drone_id = None
+
 		self.results = None
 		self.time_last_updated = 0
 		self.total_steps = 0
 		self.recent_steps = 0
 
+		# Measured training speed, and the steps in the run last dispatched
+		self.secs_per_step = None
+		self.run_steps = None
+
 
 	def update_from_result_spec(self, result_spec):
 		self.total_steps = result_spec.total_steps
 		self.recent_steps = result_spec.recent_steps
 		self.results = result_spec.results
+
+		if result_spec.secs_per_step is not None:
+			# Headers loaded from old pickles have no secs_per_step
+			prev = getattr(self, "secs_per_step", None)
+			self.secs_per_step = result_spec.secs_per_step if prev is None else 0.5 * (prev + result_spec.secs_per_step)
+
 		self.time_last_updated = time.time()
 		self.time_last_dispatched = 0
 
@@ -81,20 +135,53 @@ class WorkerHeader(object):
 		# Protecting the params, it should in theory be fine to copy all of them over
 		# self.params["model_id"] = result_spec.params["model_id"]
 
-	def gen_run_spec(self, args):
+	def gen_run_spec(self, args, param_store=None):
+		"""If param_store is given, the spec carries only a hash of the params"""
+
+		if param_store is not None:
+			# Params are never changed in place once the header exists
+			if getattr(self, "params_hash", None) is None:
+				self.params_hash = param_store.put(self.params)
+			params, params_hash = None, self.params_hash
+		else:
+			params, params_hash = self.params, None
+
+		micro_step = self.plan_micro_step(args)
+
+		# consider_exploit waits for the whole run to report back
+		self.run_steps = micro_step * args.macro_step
+
 		return RunSpec(
 			uuid.uuid4(),
 			args.run, 
 			self.id, 
 			platform.node(),
-			self.params, 
+			params, 
 			self.recent_steps,
 			self.total_steps,
-			args.micro_step, 
+			micro_step, 
 			args.macro_step,
-			time.time()
+			time.time(),
+			params_hash,
+			getattr(self, "warm_start_steps", None)
 		)
 
+	def plan_micro_step(self, args):
+		"""Steps per result. With --target-step-secs, sized from this worker's
+		measured speed so each micro step takes about that long, within a factor
+		of --adaptive-step-range of --micro-step"""
+
+		# Headers loaded from old pickles have no secs_per_step
+		secs_per_step = getattr(self, "secs_per_step", None)
+
+		if args.target_step_secs <= 0 or secs_per_step is None or secs_per_step <= 0:
+			return args.micro_step
+
+		lo = max(int(args.micro_step / args.adaptive_step_range), 1)
+		hi = max(int(args.micro_step * args.adaptive_step_range), lo)
+
+		return min(max(int(round(args.target_step_secs / secs_per_step)), lo), hi)
+
 	def dist(self, other):
 		return self.params.dist(other.params)
 
@@ -104,7 +191,9 @@ class WorkerHeader(object):
 
 	def mutate(self, heat):
 		params = self.params.mutate(heat)
-		return WorkerHeader(params)
+		child = WorkerHeader(params)
+		child.warm_start_steps = self.total_steps
+		return child
 
 
 
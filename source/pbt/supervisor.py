@@ -4,18 +4,30 @@ import time
 import pickle
 import math
 import uuid
+import platform
 from google.cloud import pubsub_v1
 import traceback
 import random
 import yaml
+import tensorflow as tf
 import logging
 logger = logging.getLogger(__name__)
 
-from util import Ploty
+from util import Ploty, PlotWriter
 
 from .specs import *
 from .param import FixedParam
-from .queue import QueueFactory
+from .queue import QueueFactory, MAX_PRIORITY
+from .ranking import RankedPopulation
+from .journal import PopulationJournal
+from .deadlines import DeadlineQueue
+from .param_store import ParamStore
+from .affinity import AffinityTable
+from .credits import CreditTable
+from .run_queue import RunQueue
+from .schedule import Scheduler, gen_scheduler
+from .chunk_store import ChunkStore
+from .weight_bundle import read_manifest
 from util import FileWritey, FileReadie
 
 class Supervisor(object):
@@ -24,7 +36,7 @@ class Supervisor(object):
 	# Initialisation and basic lifespan steps
 	# --------------------------------------------------------------------------
 
-	def __init__(self, args, param_spec, score, name_fn=None, reverse=False, gen_baseline_params=None):
+	def __init__(self, args, param_spec, score, name_fn=None, reverse=False, gen_baseline_params=None, scheduler=None):
 		self.args = args
 		self.param_spec = param_spec
 		self.score = score
@@ -33,11 +45,32 @@ class Supervisor(object):
 		self.gen_baseline_params = gen_baseline_params
 
 		self.workers = {}
+		self.ranking = RankedPopulation(self.score, self.reverse)
+		self.scheduler = scheduler if scheduler is not None else gen_scheduler(args, score, reverse)
+		self.n_scheduler_stopped = 0
+		self.n_cancelled = 0
+
+		self.chunk_store = ChunkStore.for_run(args.model_dir, args.run, args.chunk_size_kb) if args.chunk_store else None
+		self.dead_model_ids = {}
+		self.time_last_gc = time.time()
+		self.deadlines = DeadlineQueue()
+		self.n_redispatched = 0
+
+		self.affinity = AffinityTable(self.args.job_timeout)
+		self.affinity_deadlines = DeadlineQueue()
+		self.queue_drones = {}
+		self.n_affinity_dispatched = 0
+		self.n_affinity_fallbacks = 0
+
+		self.credits = CreditTable(self.args.job_timeout)
+		self.pending = RunQueue()
+		self.in_flight = set()
 		
 		self.time_last_save = time.time()
 		self.time_last_print = time.time()
 		self.print_dirty = False
 
+		self.plotter = PlotWriter(args.plot_secs)
 		self.plot_progress = Ploty(args, title='Training progress', x='Time', y="Value")
 		self.plot_best_score = Ploty(args, title='Best score', x='Time', y="Value")
 
@@ -47,32 +80,61 @@ class Supervisor(object):
 		}
 		self.ensure_has_measure("score")
 
-		self.queue_result = QueueFactory.vend(self.args, "result", "result_supervisor", "*")
-		self.queue_run = QueueFactory.vend(self.args, "run", "run_shared", "run")
+		result_types = ["result", "heartbeat"]
+		if self.args.affinity_dispatch:
+			result_types.append("affinity")
+		if self.args.flow_control:
+			result_types.append("credit")
+
+		self.queue_result = QueueFactory.vend(self.args, "result", "result_supervisor", "*", types=result_types)
+		self.queue_run = QueueFactory.vend(self.args, "run", "run_shared", "run", types=["run"],
+			max_priority=MAX_PRIORITY if self.args.priority_dispatch else None)
+
+		self.journal = PopulationJournal(self.args) if self.args.journal else None
+		# The compact wire format can't carry params, only their hash
+		use_param_store = self.args.param_store or not self.queue_run.passes_objects
+		self.param_store = ParamStore(self.args) if use_param_store else None
 		
 		if self.args.load:
 			self.load()
+		elif self.journal is not None:
+			self.journal.reset()
 		
 	def load(self):
 		logger.info("Trying to load workers from " + self.file_path)
 	
 		try:
-			with FileReadie(self.args, "workers.pkl", True) as file:
-				self.workers = pickle.load(file)
-				logger.info("Loaded {} workers".format(len(self.workers)))
+			if self.journal is not None:
+				self.workers = self.journal.load()
+			else:
+				with FileReadie(self.args, "workers.pkl", True) as file:
+					self.workers = pickle.load(file)
+			logger.info("Loaded {} workers".format(len(self.workers)))
 				
 		except Exception:
 			self.workers = {}
 
+		self.ranking.rebuild(self.workers.values())
+
+		for i in self.workers.values():
+			self.deadlines.schedule(i.id, i.time_last_updated + self.args.job_timeout)
+
 		self.time_last_save = time.time()
 
-		self.plot_progress.load()
-		self.plot_best_score.load()
+		with self.plotter.lock:
+			self.plot_progress.load()
+			self.plot_best_score.load()
 
 
 	def save(self):
 		logger.debug("Saving workers to " + self.file_path)
 
+		if self.journal is not None:
+			self.journal.flush()
+			self.journal.consider_compact(self.workers)
+			self.time_last_save = time.time()
+			return
+
 		with FileWritey(self.args, "workers.pkl", True) as file:
 			pickle.dump(self.workers, file)
 
@@ -89,6 +151,9 @@ class Supervisor(object):
 	def run_epoch(self):
 		self.scale_workers()
 		self.dispatch_idle()
+		self.dispatch_affinity_fallback()
+		self.dispatch_pending()
+		self.consider_gc()
 		self.consider_save()
 		self.consider_print()
 		self.get_messages()
@@ -147,16 +212,34 @@ class Supervisor(object):
 			newbie.results = results
 
 		self.workers[newbie.id] = newbie
+		self.ranking.add(newbie)
+		if self.journal is not None:
+			self.journal.add(newbie)
 		self.dispatch(newbie)
 
 
 	def remove_worker(self):
 		if len(self.workers) > 0:
-			stack = self.get_sorted_workers()
-			if len(stack) < self.n_workers / 2:
+			if len(self.ranking) < self.args.n_workers / 2:
 				raise ValueError("Cannot remove_worker as not enough workers have scores yet")
 			else:
-				del self.workers[stack[0].id]	
+				self.delete_worker(self.ranking.worst())
+
+	def delete_worker(self, worker):
+		self.cancel_run(worker)
+		del self.workers[worker.id]
+		self.ranking.discard(worker)
+		self.deadlines.discard(worker.id)
+		self.affinity_deadlines.discard(worker.id)
+		self.pending.discard(worker.id)
+		self.in_flight.discard(worker.id)
+		self.scheduler.on_delete(worker.id)
+
+		model_id = self.model_id(worker)
+		if self.args.checkpoint_gc_secs > 0 and model_id is not None:
+			self.dead_model_ids[model_id] = time.time()
+		if self.journal is not None:
+			self.journal.delete(worker.id)
 
 
 
@@ -165,51 +248,56 @@ class Supervisor(object):
 	# --------------------------------------------------------------------------
 
 	def find_mentor(self):
-		stack = self.get_sorted_workers()
-		
 		n20 = max(round(len(self.workers) * self.args.exploit_pct), 1)
-		top20 = stack[-n20:]
+		top20 = self.ranking.top(n20)
 
 		# Dont clone a fresh clone
-		top20 = [i for i in top20 if i.total_steps >= self.args.micro_step]
+		top20 = [i for i in top20 if i.total_steps >= self.run_steps(i)]
 
 		if len(top20) > 0:
 			return random.choice(top20)
 
 		raise ValueError("No top workers have results yet")
 
+	def run_steps(self, worker):
+		"""Steps in the worker's current run, which vary with --target-step-secs"""
+		# Headers loaded from old pickles have no run_steps, new ones have None until dispatched
+		run_steps = getattr(worker, "run_steps", None)
+		return run_steps if run_steps is not None else self.args.micro_step * self.args.macro_step
+
 	def consider_exploit(self, worker):
-		if worker.recent_steps >= self.args.micro_step * self.args.macro_step:
+		run_steps = self.run_steps(worker)
+
+		if worker.recent_steps >= run_steps:
 
+			# That was the run's last result, so there's no drone left to cancel
+			worker.lease_drone_id = None
 			worker.recent_steps = 0
-			stack = self.get_sorted_workers()
+			idx = self.ranking.rank(worker)
+			n_ranked = len(self.ranking)
 
-			try:
-				idx = stack.index(worker)
+			# It's ok if we couldn't rank that worker, it means they've no score yet
+			if idx is not None:
 
 				# if we have enough results
-				if len(stack) > 1 and len(stack) > len(self.workers)/2: 
-					nLower = max(len(stack) * self.args.exploit_pct,1)
+				if n_ranked > 1 and n_ranked > len(self.workers)/2: 
+					nLower = max(n_ranked * self.args.exploit_pct,1)
 
 					# proportionally cull the bottom tranche
 					if idx < nLower:
-						del self.workers[worker.id]
+						self.delete_worker(worker)
 						logger.info("del {}".format(worker.id))
 
 						self.add_worker() # dispatches the worker
 						return
 
 				else:
-					logger.debug("Not enough workers ({}) with results to cull and add new workers".format(len(stack)))
-
-			except ValueError:
-				# It's ok we couldn't index that worker, it means they've no score yet
-				pass
+					logger.debug("Not enough workers ({}) with results to cull and add new workers".format(n_ranked))
 
 			self.dispatch(worker)
 
 		else:
-			logger.debug("Worker {} has not worked enough {} < {} to consider exploit".format(self.name_fn(worker), self.args.micro_step * self.args.macro_step, worker.recent_steps))
+			logger.debug("Worker {} has not worked enough {} < {} to consider exploit".format(self.name_fn(worker), worker.recent_steps, run_steps))
 
 
 	def find_partner(self, worker):
@@ -237,64 +325,251 @@ class Supervisor(object):
 	# Send tasks out for work
 	# --------------------------------------------------------------------------
 
+	def get_queue_drone(self, exchange, drone_id):
+		"""Queue addressed to a single drone, e.g. its own run or lease queue"""
+		key = (exchange, drone_id)
+		if key not in self.queue_drones:
+			self.queue_drones[key] = QueueFactory.vend(self.args, exchange, exchange+"_"+drone_id, exchange+"."+drone_id, types=[exchange])
+		return self.queue_drones[key]
+
 	def dispatch(self, worker):
-		"""Request drone runs this worker"""
-		run_spec = worker.gen_run_spec(self.args)
-		self.queue_run.send(run_spec)
-		logger.info('{}.dispatch({},{})'.format(worker.id, run_spec.macro_step, run_spec.micro_step))
+		"""Request drone runs this worker
+
+		With --flow-control the worker joins the pending queue, and is sent
+		once there is a free slot (see dispatch_pending). Its previous run, if
+		any, is over so no longer counts as in flight.
+		"""
+		if not self.args.flow_control:
+			self.send_run(worker)
+			return
+
+		self.in_flight.discard(worker.id)
+		self.deadlines.discard(worker.id)
+		self.affinity_deadlines.discard(worker.id)
+		if self.args.priority_dispatch:
+			self.pending.push(worker.id, -self.run_priority(worker))
+		else:
+			self.pending.push(worker.id, time.time())
+		logger.debug('{}.dispatch() pending:{}'.format(worker.id, len(self.pending)))
+
+	def run_priority(self, worker):
+		"""From 0 for the worst ranked worker to 1 for the best, or
+		--newcomer-priority if it has no score yet"""
+		idx = self.ranking.rank(worker)
+		if idx is None:
+			return self.args.newcomer_priority
+
+		return (idx + 1) / len(self.ranking)
+
+	def dispatch_pending(self):
+		"""Send pending workers while in-flight runs are below drone capacity"""
+		if not self.args.flow_control:
+			return
+
+		limit = self.credits.capacity(time.time()) + self.args.dispatch_slack
+
+		while len(self.in_flight) < limit and len(self.pending) > 0:
+			i = self.workers.get(self.pending.pop(), None)
+			if i is not None:
+				self.send_run(i)
+
+	def send_run(self, worker, use_affinity=True):
+		"""Publish a RunSpec for this worker
+
+		With --affinity-dispatch, if a drone advertised it has this worker (or
+		the checkpoint it warm starts from) cached, the spec goes to that
+		drone's own queue first. dispatch_affinity_fallback re-sends it to the
+		shared queue if the drone hasn't started it within --affinity-timeout.
+		"""
+		run_spec = worker.gen_run_spec(self.args, self.param_store)
+
+		drone_id = None
+		if self.args.affinity_dispatch and use_affinity:
+			drone_id = self.affinity.drone_for(worker, time.time())
+
+		if drone_id is not None:
+			self.get_queue_drone("run", drone_id).send(run_spec)
+			self.affinity_deadlines.schedule(worker.id, time.time() + self.args.affinity_timeout)
+			self.n_affinity_dispatched += 1
+		else:
+			priority = None
+			if self.args.priority_dispatch:
+				priority = round(self.run_priority(worker) * MAX_PRIORITY)
+
+			self.queue_run.send(run_spec, priority)
+			self.affinity_deadlines.discard(worker.id)
+
+		logger.info('{}.dispatch({},{}) drone:{}'.format(worker.id, run_spec.macro_step, run_spec.micro_step, drone_id))
 		worker.time_last_updated = time.time()
 		worker.time_last_dispatched = time.time()
 
+		# Only the newest run holds the lease, a drone still on the previous one is told to stop
+		self.cancel_run(worker)
+		worker.lease_run_id = run_spec.id
+		worker.lease_drone_id = None
+		self.deadlines.schedule(worker.id, worker.time_last_updated + self.args.job_timeout)
+		self.in_flight.add(worker.id)
+
+		if self.journal is not None:
+			self.journal.update(worker)
+
 	def dispatch_idle(self):
-		for i in self.workers.values():
-			if time.time() - i.time_last_updated > self.args.job_timeout:
-				logger.warning('{}.dispatch_idle()'.format(i.id))
+		"""Redispatch workers not heard from within job_timeout.
+
+		Heartbeats and results only bump time_last_updated; the deadline is
+		checked against it lazily when it comes due, and pushed back if the
+		worker has been heard from since.
+		"""
+		now = time.time()
+
+		for worker_id in self.deadlines.pop_expired(now):
+			i = self.workers.get(worker_id, None)
+			if i is None:
+				continue
+
+			due = i.time_last_updated + self.args.job_timeout
+			if due > now:
+				self.deadlines.schedule(i.id, due)
+			else:
+				self.n_redispatched += 1
+				logger.warning('{}.dispatch_idle() total redispatched:{}'.format(i.id, self.n_redispatched))
 				self.dispatch(i)
 
 
 
 
+	def dispatch_affinity_fallback(self):
+		"""Re-send to the shared queue runs their preferred drone hasn't started"""
+		for worker_id in self.affinity_deadlines.pop_expired(time.time()):
+			i = self.workers.get(worker_id, None)
+
+			# Any heartbeat or result since dispatch means a drone picked it up
+			if i is not None and i.time_last_updated <= i.time_last_dispatched:
+				self.n_affinity_fallbacks += 1
+				logger.info('{}.dispatch_affinity_fallback()'.format(i.id))
+				self.send_run(i, use_affinity=False)
+
+
+	# --------------------------------------------------------------------------
+	# Leases
+	# --------------------------------------------------------------------------
+
+	def _handle_heartbeat(self, worker, spec):
+		"""Grant or renew the lease if this is the worker's current run and no
+		other drone holds it, otherwise revoke it"""
+
+		lease_run_id = getattr(worker, "lease_run_id", None)
+		lease_drone_id = getattr(worker, "lease_drone_id", None)
+
+		# Workers loaded from before leases existed adopt the first run we hear about
+		if lease_run_id is None:
+			lease_run_id = spec.run_id
+
+		granted = spec.run_id == lease_run_id and lease_drone_id in (None, spec.drone_id)
+
+		if granted:
+			worker.lease_run_id = spec.run_id
+			worker.time_last_updated = time.time()
+
+			if lease_drone_id != spec.drone_id:
+				worker.lease_drone_id = spec.drone_id
+				if self.journal is not None:
+					self.journal.update(worker)
+		else:
+			logger.info("{}.revoke_lease({}, {})".format(worker.id, spec.drone_id, spec.run_id))
+
+		self._send_lease(spec.drone_id, spec.run_id, spec.worker_id, granted)
+
+	def _send_lease(self, drone_id, run_id, worker_id, granted):
+		self.get_queue_drone("lease", drone_id).send(LeaseSpec(
+			self.args.run,
+			platform.node(),
+			run_id,
+			worker_id,
+			drone_id,
+			granted,
+			time.time() + self.args.job_timeout,
+			time.time()))
+
+	def cancel_run(self, worker):
+		"""Revoke the lease of the drone running this worker, if any, so it stops at its next step"""
+		lease_run_id = getattr(worker, "lease_run_id", None)
+		lease_drone_id = getattr(worker, "lease_drone_id", None)
+
+		if lease_run_id is not None and lease_drone_id is not None:
+			logger.info("{}.cancel_run({}, {})".format(worker.id, lease_drone_id, lease_run_id))
+			self.n_cancelled += 1
+			self._send_lease(lease_drone_id, lease_run_id, worker.id, False)
+			worker.lease_drone_id = None
+
+	def is_lease_current(self, worker, spec):
+		lease_run_id = getattr(worker, "lease_run_id", None)
+		return lease_run_id is None or spec.run_id == lease_run_id
+
+
 	# --------------------------------------------------------------------------
 	# Messaging queue logistics
 	# --------------------------------------------------------------------------
 
 	def _handle_result(self, spec, ack, nack):		
-		if spec.worker_id in self.workers:
+		if isinstance(spec, AffinitySpec):
+			self.affinity.record(spec, time.time())
+
+		elif isinstance(spec, CreditSpec):
+			self.credits.record(spec, time.time())
+
+		elif spec.worker_id in self.workers:
 			i = self.workers[spec.worker_id]
 
 			if isinstance(spec, HeartbeatSpec):
-				i.time_last_updated = time.time()
-				# logger.debug("{}.record_heartbeat({}, {}, {})".format(spec.worker_id, spec.from_hostname, spec.total_steps, spec.run_id, spec.tiebreaker))
+				self.credits.touch(spec.drone_id, time.time())
+				self._handle_heartbeat(i, spec)
 
 			elif isinstance(spec, ResultSpec):
-				if spec.success:
+				if not self.is_lease_current(i, spec):
+					logger.warning("{} rejected result from stale run {}".format(spec.worker_id, spec.run_id))
+
+				elif spec.success:
 					if spec.total_steps > i.total_steps:
 						i.update_from_result_spec(spec)
+						self.ranking.add(i)
 						logger.info("{}.record_result({})".format(spec.worker_id, spec))
 
 						self.print_dirty = True
 						self.print_worker_results(i)
-						
-						self.consider_exploit(i)
+
+						if self.scheduler.on_result(i) == Scheduler.STOP:
+							self.n_scheduler_stopped += 1
+							logger.info("del {} (scheduler)".format(i.id))
+							self.delete_worker(i)
+							self.add_worker()
+						else:
+							self.consider_exploit(i)
+
+						if self.journal is not None and i.id in self.workers:
+							self.journal.update(i)
 					else:
 						logger.warning("{} received results for {} < current total_steps {}".format(spec.worker_id, spec.total_steps, i.total_steps))
 
 				elif not self.args.run_baseline:
+					i.lease_drone_id = None
 					logger.info("del {}".format(spec.worker_id))
-					del self.workers[spec.worker_id]
+					self.delete_worker(i)
 					self.add_worker()
 
 				else:
+					i.lease_drone_id = None
 					self.dispatch(i)
-			
-			elif isinstance(spec, GiveUpSpec):
-				pass
 
 			else:
 				logger.warning("Received unknown message type {}".format(type(spec)))
 		else:
 			logger.debug("{} worker not found for message {}".format(spec.worker_id, spec))
 
+			# Deleted while a drone was training it
+			if isinstance(spec, HeartbeatSpec):
+				self._send_lease(spec.drone_id, spec.run_id, spec.worker_id, False)
+
 		# Swallow bad messages
 		# The design is for the supervisor to re-send and to re-spawn drones
 		ack()
@@ -306,6 +581,14 @@ class Supervisor(object):
 		self.queue_result.close()
 		self.queue_run.close()
 
+		for i in self.queue_drones.values():
+			i.close()
+
+		if self.journal is not None:
+			self.journal.close()
+
+		self.plotter.close()
+
 
 
 
@@ -317,13 +600,61 @@ class Supervisor(object):
 	# --------------------------------------------------------------------------
 
 
+	def model_id(self, worker, key="cur"):
+		"""The worker's own model id, or with key="warm_start_from" its mentor's"""
+		try:
+			return worker.params["model_id"].value[key]
+		except (KeyError, AttributeError, TypeError):
+			return None
+
+	def consider_gc(self):
+		if self.args.checkpoint_gc_secs > 0 and time.time() - self.time_last_gc > self.args.checkpoint_gc_secs:
+			self.collect_checkpoints()
+			self.time_last_gc = time.time()
+
+	def collect_checkpoints(self):
+		"""Delete the model dirs of deleted workers, then chunks no manifest uses.
+
+		A dead worker's dir survives while any live worker still warm starts
+		from it, and for job_timeout after its death so a cancelled drone
+		has finished writing to it.
+		"""
+		now = time.time()
+		model_root = os.path.join(self.args.model_dir, self.args.run)
+
+		in_use = set()
+		for i in self.workers.values():
+			for key in ["cur", "warm_start_from"]:
+				model_id = self.model_id(i, key)
+				if model_id is not None:
+					in_use.add(model_id)
+
+		n_removed = 0
+		for model_id, time_deleted in list(self.dead_model_ids.items()):
+			if model_id not in in_use and now - time_deleted >= self.args.job_timeout:
+				try:
+					tf.gfile.DeleteRecursively(os.path.join(model_root, model_id))
+				except tf.errors.NotFoundError:
+					pass
+
+				del self.dead_model_ids[model_id]
+				n_removed += 1
+
+		logger.info("Removed {} deleted workers' model dirs, {} waiting".format(n_removed, len(self.dead_model_ids)))
+
+		if self.chunk_store is not None:
+			manifests = []
+			for model_id in in_use.union(self.dead_model_ids.keys()):
+				try:
+					manifests.append(read_manifest(os.path.join(model_root, model_id)))
+				except tf.errors.NotFoundError:
+					pass
+
+			self.chunk_store.collect(manifests, self.args.job_timeout, now)
+
 	def get_sorted_workers(self):
 		"""Workers for which no score is known will not be returned"""
-
-		stack = [i for i in self.workers.values() if self.score(i) is not None]
-		random.shuffle(stack)
-		stack.sort(key=self.score, reverse=self.reverse)
-		return stack
+		return self.ranking.sorted()
 
 	def ensure_has_measure(self, key):
 		def get_metric(worker):
@@ -336,9 +667,10 @@ class Supervisor(object):
 			self.measures[key] = get_metric
 
 		if key not in self.plot_measures:
-			self.plot_measures[key] = Ploty(self.args, title="Metric "+key, x='Time', y=key)
-			if self.args.load:
-				self.plot_measures[key].load()
+			with self.plotter.lock:
+				self.plot_measures[key] = Ploty(self.args, title="Metric "+key, x='Time', y=key)
+				if self.args.load:
+					self.plot_measures[key].load()
 
 
 	def print_worker_results(self, worker):
@@ -353,8 +685,8 @@ class Supervisor(object):
 				val = self.measures[key](worker)
 				if val is not None:
 					plot = self.plot_measures[key]
-					plot.add_result(time.time(), val, name)
-					plot.write()
+					self.plotter.add_result(plot, time.time(), val, name)
+					self.plotter.write(plot)
 			
 
 	def print(self):
@@ -365,15 +697,13 @@ class Supervisor(object):
 				if not isinstance(val, FixedParam):
 					if isinstance(val.metric, int) or isinstance(val.metric, float):
 						if val.metric is not None:
-							plot.add_result(time.time(), val.metric, prefix+key+suffix)
+							self.plotter.add_result(plot, time.time(), val.metric, prefix+key+suffix)
 					elif isinstance(val.metric, dict):
 						for mkey, mval in val.metric.items():
 							if isinstance(mval, int) or isinstance(mval, float):
 								if mval is not None:
-									plot.add_result(time.time(), mval, prefix+key+"_"+mkey+suffix)
-
+									self.plotter.add_result(plot, time.time(), mval, prefix+key+"_"+mkey+suffix)
 
-		stack = self.get_sorted_workers()
 
 		for key, fn in self.measures.items():
 			vs = [fn(i) for i in self.workers.values() if fn(i) is not None]
@@ -381,19 +711,32 @@ class Supervisor(object):
 			if len(vs) > 0:
 				best = max(vs)
 				worst = min(vs)
-				self.plot_progress.add_result(time.time(), best, key+"_max")
-				self.plot_progress.add_result(time.time(), worst, key+"_min")
+				self.plotter.add_result(self.plot_progress, time.time(), best, key+"_max")
+				self.plotter.add_result(self.plot_progress, time.time(), worst, key+"_min")
+
+		self.plotter.add_result(self.plot_progress, time.time(), len(self.workers), "n_workers")
+		self.plotter.add_result(self.plot_progress, time.time(), self.n_redispatched, "n_redispatched")
+		self.plotter.add_result(self.plot_progress, time.time(), self.n_cancelled, "n_cancelled")
+
+		if self.args.scheduler != "none":
+			self.plotter.add_result(self.plot_progress, time.time(), self.n_scheduler_stopped, "n_scheduler_stopped")
+
+		if self.args.affinity_dispatch:
+			self.plotter.add_result(self.plot_progress, time.time(), self.n_affinity_dispatched, "n_affinity_dispatched")
+			self.plotter.add_result(self.plot_progress, time.time(), self.n_affinity_fallbacks, "n_affinity_fallbacks")
 
-		self.plot_progress.add_result(time.time(), len(self.workers), "n_workers")
+		if self.args.flow_control:
+			self.plotter.add_result(self.plot_progress, time.time(), len(self.pending), "n_pending")
+			self.plotter.add_result(self.plot_progress, time.time(), len(self.in_flight), "n_in_flight")
 
-		if len(stack) > 0:
-			best_worker = stack[-1]
+		best_worker = self.ranking.best()
+		if best_worker is not None:
 			plot_param_metrics(self.plot_progress, best_worker, suffix="_best")
 
-			self.plot_best_score.add_result(time.time(), self.score(best_worker), "score")
+			self.plotter.add_result(self.plot_best_score, time.time(), self.score(best_worker), "score")
 
-		self.plot_progress.write()
-		self.plot_best_score.write()
+		self.plotter.write(self.plot_progress)
+		self.plotter.write(self.plot_best_score)
 
 		self.print_dirty = False
 
@@ -0,0 +1,150 @@
+import os.path
+import uuid
+import json
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""Compact checkpoint of a model's variables, for --weight-bundle.
+
+	weights.json              manifest: data file name and each array's name, dtype, shape, offset
+	weights-<uuid>.bin        the arrays' raw bytes, each aligned to 64 bytes
+
+Loading memory-maps the data file, so warm starts read only the pages the
+variables occupy, with none of a TF checkpoint's index and meta graph
+parsing. The manifest is renamed into place after the data is written, so a
+reader never sees a partial bundle. The previous data file is kept until the
+save after, so a reader that has just read the old manifest (e.g. a child
+warm starting from a mentor still training) can still open it.
+
+Saved with a ChunkStore (--chunk-store) there is no data file: each array
+lists the hashes of its chunks in the run's shared store instead.
+"""
+
+MANIFEST = "weights.json"
+VERSION = 1
+VERSION_CHUNKED = 2
+ALIGN = 64
+
+
+def bundle_exists(model_dir):
+	return model_dir is not None and tf.gfile.Exists(os.path.join(model_dir, MANIFEST))
+
+
+def read_manifest(model_dir):
+	with tf.gfile.GFile(os.path.join(model_dir, MANIFEST), "r") as file:
+		return json.load(file)
+
+
+def save_bundle(model_dir, weights, store=None):
+	entries = []
+	chunks = []
+	offset = 0
+
+	for name in sorted(weights.keys()):
+		arr = np.ascontiguousarray(weights[name])
+
+		entry = {
+			"name": name,
+			"dtype": arr.dtype.str,
+			"shape": list(arr.shape),
+		}
+
+		if store is not None:
+			entry["chunks"] = store.split(arr.tobytes())
+		else:
+			pad = (-offset) % ALIGN
+			chunks.append(b"\0" * pad)
+			offset += pad
+
+			entry["offset"] = offset
+			chunks.append(arr.tobytes())
+			offset += arr.nbytes
+
+		entries.append(entry)
+
+	tf.gfile.MakeDirs(model_dir)
+
+	if store is not None:
+		manifest = {"version": VERSION_CHUNKED, "arrays": entries}
+		data_name = None
+	else:
+		data_name = "weights-{}.bin".format(uuid.uuid4().hex)
+		manifest = {"version": VERSION, "data": data_name, "arrays": entries}
+
+		with tf.gfile.GFile(os.path.join(model_dir, data_name), "wb") as file:
+			for i in chunks:
+				file.write(i)
+
+	try:
+		old_data_name = read_manifest(model_dir).get("data", None)
+	except Exception:
+		old_data_name = None
+
+	tmp_path = os.path.join(model_dir, MANIFEST + ".tmp")
+	with tf.gfile.GFile(tmp_path, "w") as file:
+		json.dump(manifest, file)
+
+	tf.gfile.Rename(tmp_path, os.path.join(model_dir, MANIFEST), overwrite=True)
+
+	keep = set([data_name, old_data_name])
+
+	for name in tf.gfile.ListDirectory(model_dir):
+		name = name.rstrip("/")
+		if name.startswith("weights-") and name.endswith(".bin") and name not in keep:
+			try:
+				tf.gfile.Remove(os.path.join(model_dir, name))
+			except tf.errors.NotFoundError:
+				pass
+
+
+def load_bundle(model_dir, store=None):
+	"""Returns dict of variable name to read-only array, memory-mapped where possible"""
+
+	manifest = read_manifest(model_dir)
+
+	if manifest.get("version", None) == VERSION_CHUNKED:
+		if store is None:
+			raise ValueError("Weight bundle in {} is chunked, needs --chunk-store".format(model_dir))
+
+		return {
+			i["name"]: np.frombuffer(store.join(i["chunks"]), dtype=np.dtype(i["dtype"])).reshape(i["shape"])
+			for i in manifest["arrays"]
+		}
+
+	if manifest.get("version", None) != VERSION:
+		raise ValueError("Unsupported weight bundle version {}".format(manifest.get("version", None)))
+
+	data_path = os.path.join(model_dir, manifest["data"])
+
+	if "://" in data_path:
+		# mmap needs a local file. Once mapped it can be unlinked straight away
+		fd, local_path = tempfile.mkstemp(suffix=".bin")
+		os.close(fd)
+		tf.gfile.Copy(data_path, local_path, overwrite=True)
+		remove_after = True
+	else:
+		local_path = data_path
+		remove_after = False
+
+	try:
+		if os.path.getsize(local_path) > 0:
+			buf = np.memmap(local_path, dtype=np.uint8, mode="r")
+		else:
+			buf = np.zeros(0, dtype=np.uint8)
+	finally:
+		if remove_after:
+			os.remove(local_path)
+
+	weights = {}
+	for i in manifest["arrays"]:
+		dtype = np.dtype(i["dtype"])
+		nbytes = int(np.prod(i["shape"], dtype=np.int64)) * dtype.itemsize
+		weights[i["name"]] = buf[i["offset"] : i["offset"]+nbytes].view(dtype).reshape(i["shape"])
+
+	return weights
+
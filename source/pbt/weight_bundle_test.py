@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+import os.path
+
+import numpy as np
+
+from .weight_bundle import save_bundle, load_bundle, bundle_exists, read_manifest
+
+class WeightBundleTestCase(unittest.TestCase):
+
+	def test_round_trip(self):
+		weights = {
+			"dnc/memory": np.random.rand(3, 5).astype(np.float32),
+			"global_step": np.int64(42),
+			"flags": np.array([True, False]),
+			"empty": np.zeros((0, 4), dtype=np.float64),
+		}
+
+		with tempfile.TemporaryDirectory() as model_dir:
+			self.assertFalse(bundle_exists(model_dir))
+			save_bundle(model_dir, weights)
+			self.assertTrue(bundle_exists(model_dir))
+
+			loaded = load_bundle(model_dir)
+
+			self.assertEqual(set(loaded.keys()), set(weights.keys()))
+			for k, v in weights.items():
+				self.assertEqual(loaded[k].dtype, np.asarray(v).dtype)
+				np.testing.assert_array_equal(loaded[k], v)
+
+	def test_overwrite_keeps_previous_data(self):
+		with tempfile.TemporaryDirectory() as model_dir:
+			save_bundle(model_dir, {"w": np.zeros(2)})
+			first = read_manifest(model_dir)["data"]
+
+			save_bundle(model_dir, {"w": np.ones(2)})
+			np.testing.assert_array_equal(load_bundle(model_dir)["w"], np.ones(2))
+
+			# A reader that got the old manifest just before the save can still open its data
+			self.assertTrue(os.path.exists(os.path.join(model_dir, first)))
+
+			save_bundle(model_dir, {"w": np.full(2, 2.0)})
+			self.assertFalse(os.path.exists(os.path.join(model_dir, first)))
+			self.assertEqual(len([i for i in os.listdir(model_dir) if i.endswith(".bin")]), 2)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,101 @@
+import os
+import threading
+import collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WeightCache(object):
+	"""Process-wide LRU of the latest weights of each model_id trained here.
+
+	SingularSessionWorker puts a snapshot (variable name to numpy array) at the
+	end of every train step, tagged with the model's total_steps. A child
+	whose warm_start_from is in the cache at the step its mentor had when it
+	was bred loads it straight into its new session instead of restoring the
+	mentor's checkpoint from disk or GCS. Drones that are threads of one
+	process share the cache, and --affinity-dispatch routes children to the
+	drone that advertised their mentor's model_id, so most exploits hit it.
+
+	Most snapshots are never read, so they may be put as a function that
+	fetches them, called on the first get. The owner must release() such an
+	entry before its session trains further or closes.
+
+	Snapshots are shared between readers and must not be mutated.
+	"""
+
+	caches = {}
+	caches_lock = threading.Lock()
+
+	@classmethod
+	def get_shared(clz, max_size):
+		# Keyed by pid so a forked child starts empty
+		key = os.getpid()
+
+		with clz.caches_lock:
+			if key not in clz.caches:
+				clz.caches[key] = clz(max_size)
+			return clz.caches[key]
+
+	def __init__(self, max_size):
+		self.max_size = max_size
+		self.lock = threading.Lock()
+		self.weights = collections.OrderedDict()
+
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.weights)
+
+	def __contains__(self, model_id):
+		return model_id in self.weights
+
+	def put(self, model_id, step, weights):
+		"""weights may be a callable returning them"""
+		with self.lock:
+			self.weights[model_id] = (step, weights)
+			self.weights.move_to_end(model_id)
+
+			while len(self.weights) > self.max_size:
+				self.weights.popitem(last=False)
+
+	def release(self, model_id):
+		"""Drops model_id's snapshot if it was never fetched"""
+		with self.lock:
+			if model_id in self.weights and callable(self.weights[model_id][1]):
+				del self.weights[model_id]
+
+	def get(self, model_id, step):
+		"""Returns the weights of model_id at step (marking them recently used) or None"""
+		with self.lock:
+			entry = self.weights.get(model_id, None)
+
+			if entry is None or entry[0] != step:
+				self.misses += 1
+				return None
+
+			weights = entry[1]
+
+			if callable(weights):
+				try:
+					weights = weights()
+				except Exception as ex:
+					logger.warning("Could not fetch weights of {} ({})".format(model_id, repr(ex)))
+					del self.weights[model_id]
+					self.misses += 1
+					return None
+
+				self.weights[model_id] = (step, weights)
+
+			self.hits += 1
+			self.weights.move_to_end(model_id)
+			return weights
+
+	@property
+	def stats(self):
+		return {
+			"size": len(self.weights),
+			"hits": self.hits,
+			"misses": self.misses,
+		}
@@ -0,0 +1,58 @@
+import unittest
+
+from .weight_cache import WeightCache
+
+class WeightCacheTestCase(unittest.TestCase):
+
+	def test_lru(self):
+		cache = WeightCache(2)
+		cache.put("a", 1, {"w": 1})
+		cache.put("b", 1, {"w": 2})
+
+		self.assertEqual(cache.get("a", 1), {"w": 1})
+
+		cache.put("c", 1, {"w": 3})
+
+		self.assertNotIn("b", cache)
+		self.assertIsNone(cache.get("b", 1))
+		self.assertEqual(cache.get("c", 1), {"w": 3})
+		self.assertEqual(cache.stats, {"size": 2, "hits": 2, "misses": 1})
+
+	def test_step_must_match(self):
+		cache = WeightCache(2)
+		cache.put("a", 10, {"w": 1})
+
+		self.assertIsNone(cache.get("a", 5))
+		self.assertIsNone(cache.get("a", None))
+		self.assertEqual(cache.get("a", 10), {"w": 1})
+
+	def test_lazy(self):
+		cache = WeightCache(2)
+		fetches = []
+
+		def fetch():
+			fetches.append(1)
+			return {"w": 1}
+
+		cache.put("a", 10, fetch)
+		self.assertEqual(fetches, [])
+
+		self.assertEqual(cache.get("a", 10), {"w": 1})
+		self.assertEqual(cache.get("a", 10), {"w": 1})
+		self.assertEqual(len(fetches), 1)
+
+		# Fetched snapshots outlive their session
+		cache.release("a")
+		self.assertIn("a", cache)
+
+		cache.put("b", 10, fetch)
+		cache.release("b")
+		self.assertNotIn("b", cache)
+
+	def test_shared(self):
+		self.assertIs(WeightCache.get_shared(2), WeightCache.get_shared(2))
+
+
+
+if __name__ == '__main__':
+	unittest.main()
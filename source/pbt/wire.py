@@ -0,0 +1,160 @@
+
+import json
+import uuid
+import struct
+import collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .specs import *
+
+"""Versioned binary wire format for specs.
+
+	magic "PB" | version u8 | type u8 | time_sent f64 | len(group) u16 | len(worker_id) u16
+	group utf-8 | worker_id utf-8
+	len(fields) u32 | fields: JSON list in schema order
+
+The fixed header can be read with peek_header, without touching the body,
+so foreign-group and expired messages are dropped cheaply. Nothing is
+pickled: params travel by their param store hash, and the params fields
+must be None.
+"""
+
+MAGIC = b"PB"
+VERSION = 1
+
+HEADER = struct.Struct(">2sBBdHH")
+LENGTH = struct.Struct(">I")
+
+Header = collections.namedtuple('Header', ['type', 'group', 'time_sent', 'worker_id', 'size'])
+
+# Fields other than group, time_sent and worker_id, with how they're encoded.
+# Fields not listed (params) must be None and decode as None.
+# New fields go on the end: a message from an older sender decodes with them None
+SCHEMAS = collections.OrderedDict([
+	(RunSpec, [
+		('id', 'uuid'), ('from_hostname', 'json'),
+		('recent_steps', 'json'), ('total_steps', 'json'), ('micro_step', 'json'),
+		('macro_step', 'json'), ('params_hash', 'json'), ('warm_start_steps', 'json'),
+	]),
+	(ResultSpec, [
+		('from_hostname', 'json'), ('results', 'json'), ('success', 'json'),
+		('steps', 'json'), ('recent_steps', 'json'), ('total_steps', 'json'),
+		('run_id', 'uuid'), ('secs_per_step', 'json'),
+	]),
+	(HeartbeatSpec, [
+		('from_hostname', 'json'), ('run_id', 'uuid'), ('drone_id', 'json'),
+		('total_steps', 'json'),
+	]),
+	(GiveUpSpec, [
+		('from_hostname', 'json'), ('run_id', 'uuid'),
+	]),
+	(AffinitySpec, [
+		('from_hostname', 'json'), ('drone_id', 'json'), ('worker_ids', 'json'),
+		('model_ids', 'json'),
+	]),
+	(LeaseSpec, [
+		('from_hostname', 'json'), ('run_id', 'uuid'), ('drone_id', 'json'),
+		('granted', 'json'), ('expires', 'json'),
+	]),
+	(CreditSpec, [
+		('from_hostname', 'json'), ('drone_id', 'json'), ('slots', 'json'),
+	]),
+])
+
+TYPES = list(SCHEMAS.keys())
+
+
+def _json_default(o):
+	# numpy scalars, e.g. from Estimator.evaluate
+	if hasattr(o, "item"):
+		return o.item()
+	raise TypeError("Cannot encode {} on the wire".format(type(o)))
+
+
+def is_wire(data):
+	return data[:len(MAGIC)] == MAGIC
+
+
+def encode(spec):
+	spec_type = type(spec)
+	schema = SCHEMAS[spec_type]
+
+	group = spec.group.encode('utf-8')
+	worker_id = str(getattr(spec, "worker_id", "")).encode('utf-8')
+
+	listed = set(name for name, kind in schema) | set(["group", "time_sent", "worker_id"])
+	for name in spec_type._fields:
+		if name not in listed and getattr(spec, name) is not None:
+			raise ValueError("{}.{} can't be sent in the compact wire format, send its param store hash".format(spec_type.__name__, name))
+
+	fields = []
+
+	for name, kind in schema:
+		value = getattr(spec, name)
+
+		if kind == 'uuid':
+			fields.append(None if value is None else str(value))
+		else:
+			fields.append(value)
+
+	fields = json.dumps(fields, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+	parts = [
+		HEADER.pack(MAGIC, VERSION, TYPES.index(spec_type), spec.time_sent, len(group), len(worker_id)),
+		group,
+		worker_id,
+		LENGTH.pack(len(fields)),
+		fields,
+	]
+
+	return b"".join(parts)
+
+
+def peek_header(data):
+	"""Reads the fixed header. Raises ValueError for unknown magic, version or type"""
+	magic, version, type_idx, time_sent, group_len, worker_id_len = HEADER.unpack_from(data, 0)
+
+	if magic != MAGIC:
+		raise ValueError("Not a wire message")
+
+	if version != VERSION or type_idx >= len(TYPES):
+		raise ValueError("Unsupported wire version {} type {}".format(version, type_idx))
+
+	offset = HEADER.size
+	group = data[offset : offset+group_len].decode('utf-8')
+	offset += group_len
+	worker_id = data[offset : offset+worker_id_len].decode('utf-8')
+	offset += worker_id_len
+
+	return Header(TYPES[type_idx], group, time_sent, worker_id, offset)
+
+
+def decode(data, header=None):
+	if header is None:
+		header = peek_header(data)
+
+	offset = header.size
+	(fields_len,) = LENGTH.unpack_from(data, offset)
+	offset += LENGTH.size
+	if offset + fields_len != len(data):
+		raise ValueError("Wire message is {} bytes, expected {}".format(len(data), offset + fields_len))
+
+	fields = iter(json.loads(data[offset : offset+fields_len].decode('utf-8')))
+
+	values = {name: None for name in header.type._fields}
+	values["group"] = header.group
+	values["time_sent"] = header.time_sent
+
+	if "worker_id" in header.type._fields:
+		values["worker_id"] = header.worker_id
+
+	for name, kind in SCHEMAS[header.type]:
+		value = next(fields, None)
+		if kind == 'uuid' and value is not None:
+			value = uuid.UUID(value)
+		values[name] = value
+
+	return header.type(**values)
+
@@ -0,0 +1,56 @@
+import unittest
+import uuid
+import time
+
+from .specs import *
+from . import wire
+
+class WireTestCase(unittest.TestCase):
+
+	def test_round_trip(self):
+		specs = [
+			RunSpec(uuid.uuid4(), "g", "w1", "host", None, 10, 20, 5, 2, time.time(), "abc123", 30),
+			ResultSpec("g", "w1", "host", {"accuracy": 0.5}, True, 5, 10, 20, None, time.time(), uuid.uuid4(), 0.25),
+			HeartbeatSpec("g", "host", uuid.uuid4(), "w1", "drone", 20, time.time()),
+			GiveUpSpec("g", "host", time.time(), uuid.uuid4(), "w1"),
+			AffinitySpec("g", "host", "drone", ["w1", "w2"], ["m1"], time.time()),
+			LeaseSpec("g", "host", uuid.uuid4(), "w1", "drone", True, time.time() + 10, time.time()),
+			CreditSpec("g", "host", "drone", 1, time.time()),
+		]
+
+		for spec in specs:
+			data = wire.encode(spec)
+			self.assertTrue(wire.is_wire(data))
+			self.assertEqual(wire.decode(data), spec)
+
+	def test_params_not_pickled(self):
+		spec = RunSpec(uuid.uuid4(), "g", "w1", "host", {"lr": 0.1}, 10, 20, 5, 2, time.time(), None, None)
+
+		with self.assertRaises(ValueError):
+			wire.encode(spec)
+
+	def test_trailing_bytes(self):
+		data = wire.encode(GiveUpSpec("g", "host", time.time(), None, "w1"))
+
+		with self.assertRaises(ValueError):
+			wire.decode(data + b"\0")
+
+		with self.assertRaises(ValueError):
+			wire.decode(data[:-1])
+
+	def test_peek_header(self):
+		spec = HeartbeatSpec("group", "host", uuid.uuid4(), "worker", "drone", 20, 123.0)
+		header = wire.peek_header(wire.encode(spec))
+
+		self.assertEqual(header.type, HeartbeatSpec)
+		self.assertEqual(header.group, "group")
+		self.assertEqual(header.worker_id, "worker")
+		self.assertEqual(header.time_sent, 123.0)
+
+	def test_unknown_version(self):
+		data = bytearray(wire.encode(GiveUpSpec("g", "host", time.time(), None, "w1")))
+		data[2] = wire.VERSION + 1
+
+		with self.assertRaises(ValueError):
+			wire.peek_header(bytes(data))
+
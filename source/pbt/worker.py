@@ -37,11 +37,14 @@ class Worker(object):
 		self.total_steps = 0
 		self.recent_steps = 0
 		self.time_started = 0
+		self.secs_per_step = None
+		self.warm_start_steps = None
 
 	def update_from_run_spec(self, run_spec):
 		self.params = run_spec.params
 		self.total_steps = run_spec.total_steps
 		self.recent_steps = run_spec.recent_steps
+		self.warm_start_steps = run_spec.warm_start_steps
 
 	# --------------------------------------------------------------------------
 	# Implement these
@@ -59,6 +62,10 @@ class Worker(object):
 		"""Returns evaluation results as a dict"""
 		pass
 
+	def close(self):
+		"""Release any sessions or other resources held between steps"""
+		pass
+
 
 
 	# --------------------------------------------------------------------------
@@ -110,13 +117,16 @@ class Worker(object):
 		
 	def step(self, steps, heartbeat, should_continue):
 		started = time.time()
-		
+
+		# do_step may set this to the time spent purely training
+		self.train_secs = None
 		self.do_step(steps, heartbeat, should_continue)
 
 		self.recent_steps += steps
 		self.total_steps += steps
 
 		time_taken = time.time() - started
+		self.secs_per_step = float(self.train_secs if self.train_secs is not None else time_taken) / float(steps)
 		tf.logging.info("train_op/second: {}".format(float(steps)/float(time_taken)))
 
 
@@ -0,0 +1,98 @@
+
+import collections
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def current_rss():
+	"""Resident set size of this process in bytes, or None if unknown"""
+	try:
+		with open("/proc/self/status") as file:
+			for line in file:
+				if line.startswith("VmRSS:"):
+					return int(line.split()[1]) * 1024
+	except (IOError, ValueError, IndexError):
+		pass
+
+	return None
+
+
+class WorkerCache(object):
+	"""LRU of constructed workers, bounded by count and by process RSS.
+
+	Evicted workers are passed to on_evict (by default worker.close(), which
+	releases their TF graphs and sessions). A max of 0 disables that bound.
+	The most recently used worker is never evicted for memory.
+
+	RSS rarely drops straight after an eviction (the allocator keeps freed
+	pages), so each trim evicts at most one worker for memory and the next
+	put re-measures, rather than flushing the whole cache.
+	"""
+
+	def __init__(self, max_size=0, max_rss_mb=0, on_evict=None):
+		self.max_size = max_size
+		self.max_rss = max_rss_mb * 1024 * 1024
+		self.on_evict = on_evict if on_evict is not None else lambda worker: worker.close()
+		self.workers = collections.OrderedDict()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.workers)
+
+	def __contains__(self, key):
+		return key in self.workers
+
+	def keys(self):
+		return self.workers.keys()
+
+	def values(self):
+		return self.workers.values()
+
+	def get(self, key):
+		"""Returns the cached worker (marking it recently used) or None"""
+		if key in self.workers:
+			self.hits += 1
+			self.workers.move_to_end(key)
+			return self.workers[key]
+
+		self.misses += 1
+		return None
+
+	def put(self, key, worker):
+		self.workers[key] = worker
+		self.workers.move_to_end(key)
+		self.trim()
+
+	def evict(self, key):
+		worker = self.workers.pop(key)
+		self.evictions += 1
+		logger.debug("Evicting worker {} from cache".format(key))
+
+		try:
+			self.on_evict(worker)
+		except Exception:
+			logger.exception("Failed to close evicted worker {}".format(key))
+
+	def trim(self):
+		while self.max_size > 0 and len(self.workers) > self.max_size:
+			self.evict(next(iter(self.workers)))
+
+		if self.max_rss > 0 and len(self.workers) > 1:
+			rss = current_rss()
+			if rss is not None and rss > self.max_rss:
+				self.evict(next(iter(self.workers)))
+
+	@property
+	def stats(self):
+		return {
+			"size": len(self.workers),
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"rss": current_rss(),
+		}
+
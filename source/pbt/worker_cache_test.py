@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from .worker_cache import WorkerCache
+
+class ClosableWorker(object):
+	def __init__(self):
+		self.closed = False
+
+	def close(self):
+		self.closed = True
+
+class WorkerCacheTestCase(unittest.TestCase):
+
+	def test_lru_eviction(self):
+		cache = WorkerCache(max_size=2)
+		workers = [ClosableWorker() for i in range(3)]
+
+		cache.put("a", workers[0])
+		cache.put("b", workers[1])
+		self.assertIs(cache.get("a"), workers[0])
+		cache.put("c", workers[2])
+
+		self.assertTrue("a" in cache)
+		self.assertFalse("b" in cache)
+		self.assertTrue(workers[1].closed)
+		self.assertFalse(workers[0].closed)
+
+		self.assertIsNone(cache.get("b"))
+		self.assertEqual(cache.hits, 1)
+		self.assertEqual(cache.misses, 1)
+		self.assertEqual(cache.evictions, 1)
+
+	def test_rss_evicts_one_per_put(self):
+		cache = WorkerCache(max_rss_mb=1)
+		workers = [ClosableWorker() for i in range(4)]
+
+		with mock.patch("pbt.worker_cache.current_rss", return_value=0):
+			for i, worker in enumerate(workers[:3]):
+				cache.put(i, worker)
+
+		# RSS stays high after evicting, as it does when freed pages aren't returned
+		with mock.patch("pbt.worker_cache.current_rss", return_value=2*1024*1024):
+			cache.put(3, workers[3])
+
+		self.assertEqual(list(cache.keys()), [1, 2, 3])
+		self.assertTrue(workers[0].closed)
+		self.assertEqual(cache.evictions, 1)
+
+	def test_unbounded(self):
+		cache = WorkerCache()
+		for i in range(100):
+			cache.put(i, ClosableWorker())
+		self.assertEqual(len(cache), 100)
+
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -31,6 +31,7 @@ REQUIRED_PACKAGES = [
 	'urllib3',
 	'Matplotlib>=2.1',
 	'dm-sonnet',
+	'sortedcontainers',
 ]
 
 setup(
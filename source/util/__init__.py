@@ -1,3 +1,3 @@
 
-from .ploty import Ploty
+from .ploty import Ploty, PlotWriter
 from .file import FileWritey, FileReadie, path_exists
\ No newline at end of file
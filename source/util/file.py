@@ -51,7 +51,7 @@ class FileReadie(FileThingy):
       client = storage.Client()
       bucket = client.get_bucket(self.args.bucket)
       blob = bucket.blob(self.gcs_path)
-      os.makedirs(self.file_dir, exist_ok=True)
+      os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
       with open(self.file_path, "wb" if self.binary else "w") as dest_file:
         try:
           blob.download_to_file(dest_file)
@@ -85,7 +85,7 @@ class FileWritey(FileThingy):
       blob.upload_from_filename(filename=self.file_path)
 
   def __enter__(self):
-    os.makedirs(self.file_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
     self.trad_file = open(self.file_path, self.open_str)
     return self.trad_file
 
@@ -5,6 +5,8 @@ import csv
 import sys
 import os.path
 import pickle
+import threading
+import queue
 
 import logging
 logger = logging.getLogger(__name__)
@@ -239,4 +241,66 @@ class Ploty(object):
     do_copy(self.title+'.png', name + '.png', 'image/png')
 
 
-  
\ No newline at end of file
+  
+
+
+
+class PlotWriter(threading.Thread):
+  """Applies Ploty results and writes plots on a background thread.
+
+  Callers queue add_result and write requests instead of touching the Ploty
+  directly. Every flush_secs the queue is drained and each plot that was asked
+  to write is written once, so a burst of results costs a single CSV, pickle,
+  PNG render and upload per plot, off the caller's thread.
+
+  Matplotlib is not thread safe: hold `lock` when constructing or loading a
+  Ploty while this writer is running.
+  """
+
+  def __init__(self, flush_secs=10):
+    super().__init__(daemon=True)
+    self.flush_secs = flush_secs
+    self.queue = queue.Queue()
+    self.lock = threading.Lock()
+    self.stopping = threading.Event()
+    self.start()
+
+  def add_result(self, plot, *args, **kwargs):
+    self.queue.put((plot, args, kwargs))
+
+  def write(self, plot):
+    self.queue.put((plot, None, None))
+
+  def _drain(self):
+    dirty = []
+
+    while True:
+      try:
+        plot, args, kwargs = self.queue.get_nowait()
+      except queue.Empty:
+        break
+
+      if args is None:
+        if plot not in dirty:
+          dirty.append(plot)
+      else:
+        plot.add_result(*args, **kwargs)
+
+    return dirty
+
+  def flush(self):
+    with self.lock:
+      for plot in self._drain():
+        try:
+          plot.write()
+        except Exception:
+          logger.exception("Failed to write plot " + plot.title)
+
+  def run(self):
+    while not self.stopping.wait(self.flush_secs):
+      self.flush()
+
+  def close(self):
+    self.stopping.set()
+    self.join()
+    self.flush()